@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# File: bench_adversarial.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Check that parsing pathological pkg-config files takes time linear in
+their size.
+
+Each case builds an adversarial input at a base size and at a multiple of
+it: a property continued over many lines, thousands of variables defined
+in a chain, a value using thousands of variables, a very long Libs line and
+a very long version string. The time taken for the larger input must grow
+no faster than the size times a tolerance, otherwise the case fails and
+the script exits with an error.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from optparse import OptionParser
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pykg_config.package import Package
+from pykg_config.pcfile import parse_pc_text, tokenize_pc
+from pykg_config.substitute import substitute
+from pykg_config.version import Version
+
+
+##############################################################################
+# Cases
+
+def continuation_chain(n):
+    # One property continued over n lines
+    text = 'Name: chain\nLibs: ' + \
+            ' \\\n'.join('-lpart{0}'.format(ii) for ii in range(n)) + '\n'
+    return lambda: list(tokenize_pc(text))
+
+
+def variable_chain(n):
+    # n variables, each defined as the previous one
+    lines = ['v0=/opt']
+    lines += ['v{0}=${{v{1}}}'.format(ii, ii - 1) for ii in range(1, n)]
+    text = '\n'.join(lines) + '\nName: chain\nCflags: -I${{v{0}}}\n'.format(
+            n - 1)
+    def run():
+        # Variables are substituted when used, so use the last one
+        raw_vars, vars, props = parse_pc_text(text, {})
+        substitute(props['cflags'], vars)
+    return run
+
+
+def many_variables(n):
+    # One value using n different variables
+    variables = dict(('v{0}'.format(ii), '/dir{0}'.format(ii))
+                     for ii in range(n))
+    value = ' '.join('-I${{v{0}}}'.format(ii) for ii in range(n))
+    return lambda: substitute(value, variables)
+
+
+def long_libs(n):
+    # A Libs line of n flags
+    libs = ' '.join('-L/opt/lib{0} -lfoo{0}'.format(ii) for ii in range(n))
+    def run():
+        Package()._parse_libs(libs, {})
+    return run
+
+
+def long_version(n):
+    # A version string of n components
+    version = '.'.join(str(ii % 10) for ii in range(n))
+    return lambda: Version(version)
+
+
+CASES = [('Continuation chain', continuation_chain, 2000),
+         ('Variable chain', variable_chain, 500),
+         ('Many variables', many_variables, 2000),
+         ('Long Libs line', long_libs, 1000),
+         ('Long version', long_version, 5000)]
+
+
+##############################################################################
+# Timing
+
+def best_time(run, repeat):
+    times = []
+    for ii in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = OptionParser(usage='Usage: %prog [options]')
+    parser.add_option('-g', '--growth', dest='growth', type='int', default=8,
+                      help='Factor by which the inputs are enlarged \
+[Default: %default]')
+    parser.add_option('-t', '--tolerance', dest='tolerance', type='float',
+                      default=2.5, help='Allowed ratio of the growth in time \
+to the growth in size [Default: %default]')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', default=5,
+                      help='Number of timed runs of each input; the best is \
+used [Default: %default]')
+    options, args = parser.parse_args()
+
+    failed = False
+    for name, make_case, size in CASES:
+        small = best_time(make_case(size), options.repeat)
+        large = best_time(make_case(size * options.growth), options.repeat)
+        ratio = large / small / options.growth
+        if ratio > options.tolerance:
+            result = 'FAIL'
+            failed = True
+        else:
+            result = 'ok'
+        print('{0:20} {1:8.4f} s -> {2:8.4f} s  x{3:.2f} per size  {4}'.format(
+            name, small, large, ratio, result))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: tw=79
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: bench_scan.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Benchmark serial and threaded scanning of the search directories.
+
+A latency is added to every stat() and scandir() call made by the searcher
+to simulate a network or overlay file system.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from optparse import OptionParser
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pykg_config import pkgsearcher
+from pykg_config.options import Options
+
+
+def make_tree(root, num_dirs, num_files):
+    dirs = []
+    for ii in range(num_dirs):
+        d = os.path.join(root, 'dir{0}'.format(ii))
+        os.mkdir(d)
+        for jj in range(num_files):
+            # Every directory shares some names, to exercise duplicates
+            name = 'pkg{0}'.format(jj if jj % 4 == 0 else (ii, jj))
+            with open(os.path.join(d, name + '.pc'), 'w') as f:
+                f.write('Name: {0}\nDescription: x\nVersion: 1\n'.format(name))
+        dirs.append(d)
+    return dirs
+
+
+def add_latency(latency):
+    real_stat = pkgsearcher.stat
+    real_scandir = pkgsearcher.scandir
+
+    def slow_stat(*args, **kwargs):
+        time.sleep(latency)
+        return real_stat(*args, **kwargs)
+
+    def slow_scandir(*args, **kwargs):
+        time.sleep(latency)
+        return real_scandir(*args, **kwargs)
+
+    pkgsearcher.stat = slow_stat
+    pkgsearcher.scandir = slow_scandir
+
+
+def scan(dirs, root, workers):
+    Options().set_option('scan_workers', workers)
+    searcher = pkgsearcher.PkgSearcher({'config_path': dirs, 'prefix': root})
+    start = time.time()
+    searcher._scan_all()
+    return time.time() - start, searcher._known_pkgs
+
+
+def main():
+    parser = OptionParser(usage='Usage: %prog [options]')
+    parser.add_option('-d', '--dirs', dest='dirs', type='int', default=32,
+                      help='Number of search directories [Default: %default]')
+    parser.add_option('-f', '--files', dest='files', type='int', default=20,
+                      help='Number of .pc files per directory \
+[Default: %default]')
+    parser.add_option('-l', '--latency', dest='latency', type='float',
+                      default=0.005,
+                      help='Seconds added to each call [Default: %default]')
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      default=8,
+                      help='Threads for the parallel scan [Default: %default]')
+    options, args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        dirs = make_tree(root, options.dirs, options.files)
+        add_latency(options.latency)
+        serial_time, serial_pkgs = scan(dirs, root, 0)
+        parallel_time, parallel_pkgs = scan(dirs, root, options.workers)
+    finally:
+        shutil.rmtree(root)
+
+    if serial_pkgs != parallel_pkgs:
+        print('Parallel scan produced a different index')
+        sys.exit(1)
+    print('{0} directories, {1} packages, {2:.1f} ms per call'.format(
+        len(dirs), len(serial_pkgs), options.latency * 1000))
+    print('Serial:   {0:.3f} s'.format(serial_time))
+    print('Parallel: {0:.3f} s ({1} workers, {2:.1f}x)'.format(parallel_time,
+        options.workers, serial_time / parallel_time))
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: tw=79
+
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: bench_tokenize.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Benchmark the single-pass .pc file tokenizer against the previous
+line-based parsing (merge_lines(), strip_comments() and
+split_pc_file_line()), which is reproduced here.
+
+Both are run over the same synthetic corpus, held in memory so that only
+the tokenizing is timed, and must produce the same records.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from optparse import OptionParser
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pykg_config.pcfile import tokenize_pc, PROPERTY, VARIABLE
+
+
+##############################################################################
+# The previous implementation
+
+def merge_lines(lines, cont_char):
+    result = []
+    ii = 0
+    while ii < len(lines):
+        new_line = lines[ii].rstrip()
+        if new_line == '':
+            ii += 1
+            continue
+        while new_line[-1] == cont_char:
+            new_line = new_line[:-2] + ' '
+            ii += 1
+            new_line += lines[ii].rstrip()
+        result.append(new_line)
+        ii += 1
+    return result
+
+
+def strip_comments(line):
+    commentStart = line.find('#')
+    if commentStart == -1:
+        return line
+    else:
+        return line[:commentStart]
+
+
+property_re = re.compile(r'(?P<key>[\w.]+):\s*(?P<value>.+)?', re.U)
+variable_re = re.compile(r'(?P<var>[\w.]+)=\s*(?P<value>.+)?', re.U)
+def split_pc_file_line(line):
+    m = property_re.match(line)
+    if m is not None:
+        return m.group('key'), m.group('value'), PROPERTY
+    m = variable_re.match(line)
+    if m is not None:
+        if m.group('value') is None:
+            return m.group('var'), '', VARIABLE
+        else:
+            return m.group('var'), m.group('value'), VARIABLE
+    return None, None, None
+
+
+def old_tokenize(text):
+    result = []
+    for line in merge_lines(text.splitlines(True), '\\'):
+        line = strip_comments(line).strip()
+        if not line:
+            continue
+        key, value, type = split_pc_file_line(line)
+        if type is not None:
+            result.append((type, key, value))
+    return result
+
+
+##############################################################################
+# Corpus
+
+def make_file(rand, index):
+    # Continued lines end in ' \' so that the previous implementation (which
+    # drops the character before the backslash) gives the same result.
+    lines = ['# Generated package {0}'.format(index),
+             'prefix=/opt/pkg{0}'.format(index),
+             'exec_prefix=${prefix}',
+             'libdir=${exec_prefix}/lib',
+             'includedir=${prefix}/include  # headers',
+             '']
+    for ii in range(rand.randint(0, 10)):
+        lines.append('extra{0}=${{prefix}}/share/{0}'.format(ii))
+    lines += ['Name: pkg{0}'.format(index),
+              'Description: Synthetic package number {0}'.format(index),
+              'Version: {0}.{1}.{2}'.format(index % 7, index % 13, index % 5),
+              'Requires: ' + ', '.join('dep{0} >= 1.0'.format(rand.randint(0,
+                  1000)) for ii in range(rand.randint(0, 6))),
+              'Libs: -L${libdir} \\',
+              '    ' + ' '.join('-lpkg{0}_{1}'.format(index, ii)
+                                for ii in range(rand.randint(1, 8))),
+              'Cflags: -I${{includedir}} -DPKG={0} \\'.format(index),
+              '    -DOTHER=1 # trailing comment',
+              '']
+    return '\n'.join(lines)
+
+
+def main():
+    parser = OptionParser(usage='Usage: %prog [options]')
+    parser.add_option('-f', '--files', dest='files', type='int', default=20000,
+                      help='Number of files in the corpus [Default: %default]')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', default=3,
+                      help='Number of timed runs; the best is reported \
+[Default: %default]')
+    options, args = parser.parse_args()
+
+    rand = random.Random(0)
+    corpus = [make_file(rand, ii) for ii in range(options.files)]
+    size = sum(len(text) for text in corpus)
+
+    for text in corpus:
+        if list(tokenize_pc(text)) != old_tokenize(text):
+            print('Tokenizers disagree on:\n' + text)
+            sys.exit(1)
+
+    def best_time(tokenize):
+        times = []
+        for ii in range(options.repeat):
+            start = time.perf_counter()
+            for text in corpus:
+                for record in tokenize(text):
+                    pass
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    old_time = best_time(old_tokenize)
+    new_time = best_time(tokenize_pc)
+    print('{0} files, {1:.1f} MiB'.format(len(corpus), size / 2.0**20))
+    print('Line-based:  {0:.3f} s'.format(old_time))
+    print('Single-pass: {0:.3f} s ({1:.2f}x)'.format(new_time,
+                                                      old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: tw=79
@@ -36,15 +36,21 @@ __version__ = "$Revision: $"
 
 from optparse import OptionParser, OptionError
 from os import getenv
+from os.path import join
 import sys
 import traceback
 
 from .errorprinter import ErrorPrinter
-from .result import PkgCfgResult, NoPackagesSpecifiedError
+from .result import PkgCfgResult, NoPackagesSpecifiedError, \
+        PackageConflictError
 from .options import Options
 from .version import Version
-from .pkgsearcher import PackageNotFoundError, NoOpenableFilesError
-from .substitute import UndefinedVarError
+from .manifest import MANIFEST_FILENAME, write_manifest
+from .pkgcache import PackageCache
+from .pkgsearcher import PkgSearcher, PackageNotFoundError, \
+        NoOpenableFilesError, StatCache
+from .substitute import InfiniteRecursionError, UndefinedVarError
+from .validate import validate_all
 
 PYKG_CONFIG_VERSION = '1.1.0'
 CORRESPONDING_VERSION = '0.26'
@@ -95,6 +101,10 @@ Return metainformation about installed libraries.'
     parser.add_option('--define-variable', dest='define_variable',
                       type='string', action='append',
                       help='Set the value of a variable'),
+    parser.add_option('--define-variable-set', dest='define_variable_set',
+                      type='string', action='append',
+                      help='Print the results again with the variables in a \
+comma-separated list of VARIABLENAME=VALUE set; may be given more than once'),
     parser.add_option('--exists', dest='exists', action='store_true',
                       default=False, help='Return 0 if the module(s) exist')
     parser.add_option('--uninstalled', dest='uninstalled', action='store_true',
@@ -114,7 +124,21 @@ version')
                       help='Return 0 if the module is no newer than the given \
 version')
     parser.add_option('--list-all', dest='list_all', action='store_true',
-                      default=False, help='List all known packages')
+                      default=False, help='List all known packages, or those \
+matching the given shell-style patterns')
+    parser.add_option('--list-names', dest='list_names', action='store_true',
+                      default=False, help='List the names of the known \
+packages matching the given shell-style patterns, without reading them')
+    parser.add_option('--validate-all', dest='validate_all',
+                      action='store_true', default=False,
+                      help='Check every known package for errors')
+    parser.add_option('--jobs', dest='jobs', type='int', action='store',
+                      default=None, help='Number of processes used by \
+--validate-all [Default: number of CPUs]')
+    parser.add_option('--generate-manifests', dest='generate_manifests',
+                      action='store_true', default=False,
+                      help='Write a manifest of the .pc files in each given \
+directory, or in each directory in the search path if none are given')
     parser.add_option('--debug', dest='debug', action='store_true',
                       default=False, help='Show verbose debug information')
     parser.add_option('--print-errors', dest='print_errors',
@@ -209,6 +233,16 @@ def main():
         if r:
             global_variables[var_name] = postprocessor(r)
 
+    if getenv('PYKG_CONFIG_CACHE_DIR'):
+        Options().set_option('cache_dir', getenv('PYKG_CONFIG_CACHE_DIR'))
+    if getenv('PYKG_CONFIG_SCAN_WORKERS'):
+        try:
+            Options().set_option('scan_workers',
+                                 int(getenv('PYKG_CONFIG_SCAN_WORKERS')))
+        except ValueError:
+            print('Bad value for PYKG_CONFIG_SCAN_WORKERS: {0}'.format(
+                getenv('PYKG_CONFIG_SCAN_WORKERS')))
+            sys.exit(1)
     if getenv('PKG_CONFIG_DISABLE_UNINSTALLED'):
         Options().set_option('prefer_uninstalled', False)
     if getenv('PKG_CONFIG_ALLOW_SYSTEM_LIBS'):
@@ -286,11 +320,22 @@ def main():
         else:
             Options().set_option('print_errors', False)
 
+    if (options.exists or options.modversion or options.atleast_version or \
+            options.exact_version or options.max_version) and \
+            not (options.libs or options.libs_only_l or \
+                 options.libs_only_big_l or options.libs_only_other or \
+                 options.cflags or options.cflags_only_big_i or \
+                 options.cflags_only_other or options.variable or \
+                 options.dump_package):
+        # Only the names, versions and requirements of the packages are
+        # needed
+        Options().set_option('header_only', True)
+
     if options.list_all:
         Options().set_option('command', 'list-all')
         try:
             result = PkgCfgResult(global_variables)
-            all_packages, errors = result.known_packages_list()
+            all_packages, errors = result.known_packages_list(args or None)
         except:
             ErrorPrinter().error('Exception searching for packages:')
             traceback.print_exc()
@@ -303,50 +348,102 @@ def main():
             ErrorPrinter().error(e)
         sys.exit(0)
 
+    if options.list_names:
+        Options().set_option('command', 'list-names')
+        searcher = PkgSearcher(global_variables)
+        names = set()
+        for pattern in args or ['*']:
+            names.update(searcher.package_names_matching(pattern))
+        for name in sorted(names):
+            print(name)
+        sys.exit(0)
+
+    if options.validate_all:
+        Options().set_option('command', 'validate-all')
+        problems = validate_all(global_variables, options.jobs)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        sys.exit(0)
+
+    if options.generate_manifests:
+        try:
+            if args:
+                dirs = args
+            else:
+                dirs = PkgSearcher(global_variables).search_dirs()
+            for d in dirs:
+                write_manifest(d)
+                print(join(d, MANIFEST_FILENAME))
+        except (IOError, OSError) as e:
+            ErrorPrinter().error('Failed to write manifest: {0}'.format(e))
+            sys.exit(1)
+        sys.exit(0)
+
+    Options().set_option('command', 'search')
+    search = ' '.join(args)
+    Options().set_option('search_string', search)
+
+    if options.define_variable_set:
+        # Each file is read once; its package is evaluated again for each
+        # set of variables. The exit status is 1 if a check fails for any
+        # set.
+        stat_cache = StatCache()
+        package_cache = PackageCache()
+        status = 0
+        for var_set in options.define_variable_set:
+            set_variables = dict(global_variables)
+            for var_def in var_set.split(','):
+                sub_strings = var_def.split('=')
+                if len(sub_strings) != 2:
+                    print('Bad argument format for define-variable-set: \
+{0}'.format(var_set))
+                    sys.exit(1)
+                set_variables[sub_strings[0]] = sub_strings[1]
+            searcher = PkgSearcher(set_variables, stat_cache=stat_cache,
+                                   package_cache=package_cache)
+            result = find_packages(search, set_variables, searcher)
+            status = max(status, process_result(options, result))
+        sys.exit(status)
+
+    result = find_packages(search, global_variables)
+    status = process_result(options, result)
+    if status:
+        sys.exit(status)
+
+
+def process_result(options, result):
+    # Check or print the information about the found packages requested by
+    # the options. Returns the exit status. Variables and flags are
+    # substituted when they are used, so errors in them are reported here.
     try:
-        Options().set_option('command', 'search')
-        search = ' '.join(args)
-        Options().set_option('search_string', search)
-        result = PkgCfgResult(global_variables)
-        result.find_packages(search, True)
-    except NoOpenableFilesError as e:
-        ErrorPrinter().verbose_error(str(e))
-        sys.exit(1)
-    except PackageNotFoundError as e:
-        if not Options().get_option('short_errors'):
-            ErrorPrinter().verbose_error('''Package {0} was not found in the \
-pkg-config search path.
-Perhaps you should add the directory containing `{0}.pc'
-to the PKG_CONFIG_PATH environment variable'''.format(e.pkgname))
-        ErrorPrinter().verbose_error(str(e))
-        sys.exit(1)
-    except NoPackagesSpecifiedError:
-        Options().get_option('error_dest').write(
-            'Must specify package names on the command line\n')
-        sys.exit(1)
+        return check_result(options, result)
     except UndefinedVarError as e:
         ErrorPrinter().error("Variable '{0}' not defined in '{1}'".format(
             e.variable, e.pkgfile))
-        sys.exit(1)
-    except:
-        print('Exception searching for packages')
-        traceback.print_exc()
-        sys.exit(1)
+        return 1
+    except InfiniteRecursionError as e:
+        ErrorPrinter().error("Variable '{0}' refers to itself in '{1}'".format(
+            e.variable, e.pkgfile))
+        return 1
+
 
+def check_result(options, result):
     if options.dump_package:
         result.dump_package()
-        sys.exit(0)
+        return 0
 
     if options.exists:
         # Even if the packages don't meet the requirements, they exist, which
         # is good enough for the exists option.
-        sys.exit(0)
+        return 0
     if options.uninstalled:
         # Check if any packages loaded (both searched-for and dependencies)
         # are uninstalled.
         if result.have_uninstalled():
-            sys.exit(0)
-        sys.exit(1)
+            return 0
+        return 1
 
     if options.modversion:
         for l in result.get_searched_pkgs_versions():
@@ -355,17 +452,62 @@ to the PKG_CONFIG_PATH environment variable'''.format(e.pkgname))
         result.get_package_version(result.get_searched_pkg_list()[0].name)
     if options.atleast_version:
         if found_version < Version(options.atleast_version):
-            sys.exit(1)
-        sys.exit(0)
+            return 1
+        return 0
     if options.exact_version:
         if found_version != Version(options.exact_version):
-            sys.exit(1)
-        sys.exit(0)
+            return 1
+        return 0
     if options.max_version:
         if found_version > Version(options.max_version):
-            sys.exit(1)
-        sys.exit(0)
+            return 1
+        return 0
+
+    print_results(options, result)
+    return 0
+
+
+def find_packages(search, global_variables, searcher=None):
+    # Find the packages in the search string, exiting if they cannot be
+    # found
+    try:
+        result = PkgCfgResult(global_variables, searcher=searcher)
+        result.find_packages(search, True)
+    except NoOpenableFilesError as e:
+        ErrorPrinter().verbose_error(str(e))
+        sys.exit(1)
+    except PackageNotFoundError as e:
+        if not Options().get_option('short_errors'):
+            ErrorPrinter().verbose_error('''Package {0} was not found in the \
+pkg-config search path.
+Perhaps you should add the directory containing `{0}.pc'
+to the PKG_CONFIG_PATH environment variable'''.format(e.pkgname))
+        ErrorPrinter().verbose_error(str(e))
+        sys.exit(1)
+    except NoPackagesSpecifiedError:
+        Options().get_option('error_dest').write(
+            'Must specify package names on the command line\n')
+        sys.exit(1)
+    except PackageConflictError as e:
+        ErrorPrinter().verbose_error(str(e))
+        sys.exit(1)
+    except UndefinedVarError as e:
+        ErrorPrinter().error("Variable '{0}' not defined in '{1}'".format(
+            e.variable, e.pkgfile))
+        sys.exit(1)
+    except InfiniteRecursionError as e:
+        ErrorPrinter().error("Variable '{0}' refers to itself in '{1}'".format(
+            e.variable, e.pkgfile))
+        sys.exit(1)
+    except:
+        print('Exception searching for packages')
+        traceback.print_exc()
+        sys.exit(1)
+    return result
+
 
+def print_results(options, result):
+    # Print the variable and flags requested
     if options.variable:
         value = result.get_variable_value(options.variable)
         if value == None:
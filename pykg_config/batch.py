@@ -0,0 +1,91 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: batch.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Resolution of the same packages for several configurations at once.
+
+When cross-compiling one set of dependencies for several target triples
+and sysroots, resolving each configuration in its own process repeats the
+same directory scans and parses the same (often identical) pkg-config
+files. Resolving them together lets the searchers share their stat() results
+and parsed packages; only the processing of Cflags and Libs, which
+depends on the sysroot, is done separately for each configuration.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from pykg_config.exceptions import PykgConfigError
+from pykg_config.pkgcache import PackageCache
+from pykg_config.pkgsearcher import PkgSearcher, StatCache
+from pykg_config.result import PkgCfgResult
+
+##############################################################################
+# Public functions
+
+def resolve_batch(pkglist, configs, globals={}, recurse=True):
+    """Find the packages in pkglist (a textual list of package
+    specifications, as for PkgCfgResult.find_packages()) for each of a list
+    of configurations.
+
+    Each configuration is a (triple, sysroot, search_path) tuple, where
+    triple is a TargetTriple, sysroot is the value for pc_sysrootdir and
+    search_path is a list of directories to search before the default
+    directories. Any of them may be None to use the default. The given
+    global variables are used for all configurations.
+
+    Returns a list with an entry for each configuration, in the same order:
+    either a PkgCfgResult, or the PykgConfigError raised while finding the
+    packages for that configuration.
+
+    """
+    stat_cache = StatCache()
+    package_cache = PackageCache()
+    results = []
+    for triple, sysroot, search_path in configs:
+        config_globals = dict(globals)
+        if sysroot is not None:
+            config_globals['pc_sysrootdir'] = sysroot
+        if search_path is not None:
+            config_globals['config_path'] = list(search_path)
+        searcher = PkgSearcher(config_globals, stat_cache=stat_cache,
+                               triple=triple, package_cache=package_cache)
+        result = PkgCfgResult(config_globals, searcher=searcher)
+        try:
+            result.find_packages(pkglist, recurse)
+        except PykgConfigError as e:
+            results.append(e)
+            continue
+        results.append(result)
+    return results
+
+
+# vim: tw=79
@@ -0,0 +1,246 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: dirindex.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Persistent index of the pkg-config files in each search directory.
+
+Listing every search directory on every invocation is expensive on slow
+(e.g. network-mounted) file systems. The index stores the .pc files found
+in each directory along with the directory's modification time. Adding,
+removing or renaming a file changes the modification time of the
+directory containing it, so an entry can be revalidated with a single
+stat() call and only directories that have changed need to be listed
+again.
+
+The index also records the packages that were looked for and not found in
+any of a list of search directories. Such a negative entry stays valid for
+as long as none of the directories' modification times change, so probing
+for an absent package again costs one stat() call per search directory. The
+names that no package in those directories provides (see the Provides field)
+are recorded in the same way.
+
+Finally, the index records the raw value of the Provides field of each .pc
+file, along with the file's size, modification time and inode, so that
+virtual packages can be looked up without opening every file again.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import json
+from os import getpid, makedirs, remove, replace
+from os.path import abspath, dirname, join
+import time
+
+from pykg_config.errorprinter import ErrorPrinter
+
+# Version of the on-disk format. Files with a different version are ignored.
+INDEX_FORMAT = 1
+# Name of the index file within the cache directory.
+INDEX_FILENAME = 'dirindex.json'
+# Directories modified more recently than this (in nanoseconds) before the
+# index is written are not stored, because a change made within the same
+# file system timestamp tick would not alter the recorded mtime.
+RACY_INTERVAL = 2 * 10**9
+
+##############################################################################
+# DirIndex object
+
+class DirIndex:
+    """Map of search directories to the .pc files they contain, stored in a
+    file and validated using directory modification times.
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._dirs = {}
+        self._missing = {}
+        self._provides = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def in_cache_dir(cls, cache_dir):
+        """Get the index stored in the given cache directory."""
+        return cls(join(cache_dir, INDEX_FILENAME))
+
+    def get(self, d, mtime):
+        """Get the stored names of the .pc files in a directory, in listing
+        order, or None if there is no entry or the directory's mtime (in
+        nanoseconds) no longer matches the recorded one.
+
+        """
+        entry = self._dirs.get(abspath(d))
+        if entry is not None and entry['mtime'] == mtime:
+            ErrorPrinter().debug_print('Using indexed listing of %s', (d))
+            return entry['files']
+        ErrorPrinter().debug_print('Index entry for %s is missing or stale', (d))
+        return None
+
+    def set(self, d, mtime, files):
+        """Store the names of the .pc files in a directory that had the given
+        mtime (in nanoseconds) when it was listed.
+
+        """
+        if time.time_ns() - mtime > RACY_INTERVAL:
+            self._dirs[abspath(d)] = {'mtime': mtime, 'files': files}
+            self._dirty = True
+
+    def get_missing(self, dirs, mtimes):
+        """Get the names of the packages recorded as being in none of the
+        given search directories, which must have the given mtimes (in
+        nanoseconds) for the record to be valid.
+
+        """
+        return self._get_names('names', dirs, mtimes)
+
+    def add_missing(self, dirs, mtimes, name):
+        """Record that a package is in none of the given search directories,
+        which had the given mtimes (in nanoseconds) when they were searched.
+        Records made for other mtimes of the same directories are dropped.
+
+        """
+        self._add_name('names', dirs, mtimes, name)
+
+    def get_unprovided(self, dirs, mtimes):
+        """Get the names recorded as provided by none of the packages in the
+        given search directories, as for get_missing().
+
+        """
+        return self._get_names('unprovided', dirs, mtimes)
+
+    def add_unprovided(self, dirs, mtimes, name):
+        """Record that no package in the given search directories provides
+        a name, as for add_missing().
+
+        """
+        self._add_name('unprovided', dirs, mtimes, name)
+
+    def get_provides(self, pcfile, st):
+        """Get the stored (raw variables, raw Provides value) of a .pc file,
+        or None if there is no entry or the given stat() result of the file
+        no longer matches the recorded one.
+
+        """
+        entry = self._provides.get(abspath(pcfile))
+        if entry is None or entry['id'] != _file_id(st):
+            return None
+        return entry['vars'], entry['provides']
+
+    def set_provides(self, pcfile, st, raw_vars, provides):
+        """Store the raw Provides value of a .pc file that had the given
+        stat() result before it was read, with the raw variables it uses.
+
+        """
+        if time.time_ns() - st.st_mtime_ns > RACY_INTERVAL:
+            self._provides[abspath(pcfile)] = {'id': _file_id(st),
+                                               'vars': raw_vars,
+                                               'provides': provides}
+            self._dirty = True
+
+    def save(self):
+        """Write the index back to its file if it has changed.
+
+        The file is replaced atomically, so concurrent processes will see
+        either the old or the new index, never a partial one. Failure to
+        write the index is not an error.
+
+        """
+        if not self._dirty:
+            return
+        tmp_name = '{0}.{1}.tmp'.format(self.filename, getpid())
+        try:
+            makedirs(dirname(abspath(self.filename)), exist_ok=True)
+            with open(tmp_name, 'w') as f:
+                json.dump({'format': INDEX_FORMAT, 'dirs': self._dirs,
+                           'missing': self._missing,
+                           'provides': self._provides}, f)
+            replace(tmp_name, self.filename)
+            self._dirty = False
+        except (IOError, OSError) as e:
+            ErrorPrinter().debug_print('Failed to write index %s: %s',
+                                       (self.filename, e))
+            try:
+                remove(tmp_name)
+            except OSError:
+                pass
+
+    def _get_names(self, kind, dirs, mtimes):
+        # Get a list of names recorded for the search directories
+        entry = self._missing.get(_dirs_key(dirs))
+        if entry is not None and entry['mtimes'] == list(mtimes):
+            return entry.get(kind, [])
+        return []
+
+    def _add_name(self, kind, dirs, mtimes, name):
+        # Add a name to a list recorded for the search directories
+        now = time.time_ns()
+        if any(now - mtime <= RACY_INTERVAL for mtime in mtimes):
+            return
+        key = _dirs_key(dirs)
+        entry = self._missing.get(key)
+        if entry is None or entry['mtimes'] != list(mtimes):
+            entry = {'mtimes': list(mtimes), 'names': [], 'unprovided': []}
+            self._missing[key] = entry
+        names = entry.setdefault(kind, [])
+        if name not in names:
+            names.append(name)
+            self._dirty = True
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get('format') != INDEX_FORMAT:
+            return
+        self._dirs = data.get('dirs', {})
+        self._missing = data.get('missing', {})
+        self._provides = data.get('provides', {})
+
+
+##############################################################################
+# Private functions
+
+def _dirs_key(dirs):
+    # Key of a list of search directories in the record of missing packages
+    return '\n'.join(abspath(d) for d in dirs)
+
+
+def _file_id(st):
+    # The parts of a file's status that change when it is replaced or
+    # modified
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+# vim: tw=79
+
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# File: flags.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Splits the values of Cflags and Libs into flags.
+
+Values are split the same way as shlex.split() does, which is the
+behaviour pykg-config has always had: Cflags in shlex's non-POSIX mode,
+where quotes only have meaning at the start of a flag and are kept, and
+Libs in POSIX mode, where quotes may appear anywhere in a flag, are
+removed, and backslashes escape characters. Each flag is classified as it
+is split. Rather than stepping through the value a character at a time as
+shlex does, each flag is matched by a regular expression.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import re
+
+# Kinds of flags
+INCLUDE_DIR = 0
+LIB = 1
+LIB_PATH = 2
+FRAMEWORK = 3
+OTHER = 4
+
+##############################################################################
+# Public functions
+
+def split_cflags(value):
+    """Split the value of a Cflags property into a list of (kind, flag)
+    pairs. The kind is INCLUDE_DIR for -I flags and OTHER for anything
+    else.
+
+    Raises ValueError if a quote is not closed.
+
+    """
+    if '"' in value or "'" in value:
+        flags = _cflag_re.findall(value)
+        for flag in flags:
+            if flag == '"' or flag == "'":
+                raise ValueError('No closing quotation')
+    else:
+        flags = _plain_flag_re.findall(value)
+    return [(INCLUDE_DIR if flag.startswith('-I') else OTHER, flag)
+            for flag in flags]
+
+
+def split_libs(value):
+    """Split the value of a Libs or Libs.private property into a list of
+    (kind, flag) pairs. The kind is LIB for -l flags, LIB_PATH for -L
+    flags, FRAMEWORK for the flag following a -framework flag (which is
+    itself dropped) and OTHER for anything else.
+
+    Raises ValueError if a quote is not closed or the value ends in an
+    escape character.
+
+    """
+    if '"' in value or "'" in value or '\\' in value:
+        flags = _split_posix(value)
+    else:
+        flags = _plain_flag_re.findall(value)
+    result = []
+    ii = 0
+    while ii < len(flags):
+        flag = flags[ii]
+        if flag.startswith('-l'):
+            result.append((LIB, flag))
+        elif flag.startswith('-L'):
+            result.append((LIB_PATH, flag))
+        elif flag.startswith('-framework') and ii + 1 < len(flags):
+            ii += 1
+            result.append((FRAMEWORK, flags[ii]))
+        else:
+            result.append((OTHER, flag))
+        ii += 1
+    return result
+
+
+##############################################################################
+# Private functions
+
+# A flag with no quotes or escapes
+_plain_flag_re = re.compile(r'[^ \t\r\n]+')
+# A non-POSIX flag: a quoted string, or a word not starting with a quote.
+# An unclosed quote matches alone.
+_cflag_re = re.compile(r'"[^"]*"|\'[^\']*\'|[^ \t\r\n\'"][^ \t\r\n]*|[\'"]')
+# A POSIX flag after any leading whitespace, made of unquoted characters,
+# escaped characters and quoted strings
+_posix_flag_re = re.compile(r'''[ \t\r\n]*((?:[^ \t\r\n'"\\]+|\\.|'[^']*'|
+                            "(?:[^"\\]|\\.)*")*)''', re.S | re.X)
+# A part of a POSIX flag with a meaning: an escaped character, a single- or
+# a double-quoted string
+_posix_part_re = re.compile(r'''\\(.)|'([^']*)'|"((?:[^"\\]|\\.)*)"''', re.S)
+# An escape within a double-quoted string
+_posix_quoted_escape_re = re.compile(r'\\([\\"])')
+
+
+def _split_posix(value):
+    # Split a value as shlex.split() does in POSIX mode
+    flags = []
+    pos = 0
+    end = len(value)
+    while True:
+        m = _posix_flag_re.match(value, pos)
+        flag = m.group(1)
+        pos = m.end()
+        if not flag:
+            if pos == end:
+                return flags
+            elif value[pos] == '\\':
+                raise ValueError('No escaped character')
+            raise ValueError('No closing quotation')
+        if '"' in flag or "'" in flag or '\\' in flag:
+            flag = _posix_part_re.sub(_unquote, flag)
+        flags.append(flag)
+
+
+def _unquote(m):
+    escaped, single, double = m.groups()
+    if escaped is not None:
+        return escaped
+    elif single is not None:
+        return single
+    return _posix_quoted_escape_re.sub(r'\1', double)
+
+
+# vim: tw=79
@@ -0,0 +1,162 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: manifest.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Per-directory manifests of pkg-config files.
+
+A manifest is a small file placed in a pkgconfig directory (typically by
+a distribution's packaging tools) that lists every .pc file in that
+directory, along with each file's size, modification time, name, version,
+description and the virtual packages it provides. While the modification
+time recorded in the manifest matches that of the directory, the manifest
+can be used instead of listing the directory. The name, version and
+description of a file can be used instead of parsing it while the file's
+size and modification time match those recorded.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from collections import OrderedDict
+import json
+from os import scandir, stat
+from os.path import join
+
+from pykg_config.errorprinter import ErrorPrinter
+from pykg_config.exceptions import PykgConfigError
+from pykg_config.package import Package
+
+# Version of the manifest format. Manifests with a different version are
+# ignored.
+MANIFEST_FORMAT = 1
+# Name of the manifest file within a pkgconfig directory.
+MANIFEST_FILENAME = '.pcmanifest'
+
+##############################################################################
+# Manifest object
+
+class Manifest:
+    """The contents of a directory's manifest.
+
+    Attributes:
+        mtime -- The mtime of the directory, in nanoseconds, when the
+                 manifest was written.
+        entries -- Dictionary of the .pc files in the directory, in listing
+                   order, each linked to a dictionary with the keys 'size',
+                   'mtime', 'name', 'version', 'description' and
+                   'provides' (the value of the Provides field). The last
+                   four are None if the file could not be parsed, and
+                   'provides' may be missing in manifests written by older
+                   versions.
+
+    """
+    def __init__(self, mtime, entries):
+        self.mtime = mtime
+        self.entries = entries
+
+    @classmethod
+    def read(cls, d):
+        """Read the manifest in a directory. Returns None if there is no
+        manifest or it cannot be read.
+
+        """
+        try:
+            with open(join(d, MANIFEST_FILENAME), 'r') as f:
+                data = json.load(f)
+            if data['format'] != MANIFEST_FORMAT:
+                return None
+            entries = OrderedDict((e['file'], e) for e in data['files'])
+            return cls(data['mtime'], entries)
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def pc_files(self):
+        """Get the names of the .pc files listed in the manifest."""
+        return list(self.entries)
+
+    def header(self, filename, st):
+        """Get the recorded entry for a .pc file if it is still valid for
+        the given stat() result of that file, or None.
+
+        """
+        entry = self.entries.get(filename)
+        if entry is None or entry['name'] is None or st is None or \
+                entry['size'] != st.st_size or \
+                entry['mtime'] != st.st_mtime_ns:
+            return None
+        return entry
+
+
+##############################################################################
+# Public functions
+
+def write_manifest(d):
+    """Write a manifest for all the .pc files in a directory.
+
+    Returns the written Manifest.
+
+    """
+    filename = join(d, MANIFEST_FILENAME)
+    # Creating the manifest changes the directory's mtime, so make sure it
+    # exists before recording the mtime. Rewriting an existing file does not
+    # change the mtime of its directory.
+    open(filename, 'a').close()
+    dir_mtime = stat(d).st_mtime_ns
+    entries = OrderedDict()
+    with scandir(d) as dir_entries:
+        for e in dir_entries:
+            if not e.name.endswith('.pc') or e.is_dir():
+                continue
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            entry = {'file': e.name, 'size': st.st_size,
+                     'mtime': st.st_mtime_ns, 'name': None, 'version': None,
+                     'description': None, 'provides': None}
+            try:
+                pkg = Package(e.path, header_only=True)
+                entry['name'] = pkg.properties['name']
+                entry['version'] = str(pkg.properties['version'])
+                entry['description'] = pkg.properties['description']
+                entry['provides'] = pkg.expanded_props['provides']
+            except (IOError, PykgConfigError) as err:
+                ErrorPrinter().debug_print('Not recording header of %s: %s',
+                                           (e.path, err))
+            entries[e.name] = entry
+    with open(filename, 'w') as f:
+        json.dump({'format': MANIFEST_FORMAT, 'mtime': dir_mtime,
+                   'files': list(entries.values())}, f, indent=1)
+    return Manifest(dir_mtime, entries)
+
+
+# vim: tw=79
+
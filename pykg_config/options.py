@@ -82,7 +82,10 @@ class Options(object):
                         'forbidden_cflags': [],
                         'is_64bit': False,
                         'full_compatibility': False,
-                        'normalise_paths': True}
+                        'normalise_paths': True,
+                        'cache_dir': '',
+                        'scan_workers': 0,
+                        'header_only': False}
 
     def set_option(self, option, value):
         if not hasattr(self, 'options'):
@@ -38,16 +38,20 @@ Stores information read from a pkg-config file.
 __version__ = "$Revision: $"
 # $Source$
 
-from copy import deepcopy
+from collections.abc import MutableMapping
+from copy import copy, deepcopy
+from itertools import chain
 from os.path import abspath, dirname, join, normpath
 import re
-import shlex
 import sys
 
 from pykg_config.errorprinter import ErrorPrinter
 from pykg_config.exceptions import ParseError
+from pykg_config.flags import split_cflags, split_libs, INCLUDE_DIR, LIB, \
+        LIB_PATH
 from pykg_config.pcfile import read_pc_file
-from pykg_config.substitute import substitute
+from pykg_config.substitute import get_all_substitutions, substitute, \
+        InfiniteRecursionError, UndefinedVarError, Variables
 from pykg_config.props import *
 from pykg_config.options import Options
 from pykg_config.packagespeclist import parse_package_spec_list
@@ -62,7 +66,11 @@ class Package:
 
     """
 
-    def __init__(self, filename=None, globals={}):
+    def __init__(self, filename=None, globals={}, header_only=False):
+        # If header_only is True, only the properties in HEADER_PROPERTIES
+        # are read, and only the variables they use are substituted. The
+        # flag properties are left empty.
+        self.header_only = header_only
         # Different platforms may use different flags and extensions
         if sys.platform == 'win32' and Options().get_option('use_msvc_syntax'):
             self.lib_suffix = '.lib'
@@ -71,7 +79,7 @@ class Package:
 
         # Parse a file if one was given
         if filename is not None:
-            self.load_from_pc_file(filename, globals)
+            self.load_from_pc_file(filename, globals, header_only)
             if filename.endswith('-uninstalled'):
                 self.uninstalled = True
             else:
@@ -83,14 +91,14 @@ class Package:
         result = self.filename + '\nProperties:\n'
         for key in self.properties:
             if key == 'requires' or key == 'requires.private' or \
-                    key == 'conflicts':
+                    key == 'conflicts' or key == 'provides':
                 result += '%s:\t%s\n' % \
                             (key, [str(a) for a in self.properties[key]])
             else:
                 result += '%s:\t%s\n' % (key, self.properties[key])
         result += 'Variables:\n'
         for key in self.variables:
-            result += '%s:\t%s\n' % (key, self.variables[key])
+            result += '%s:\t%s\n' % (key, self.get_variable(key))
         return result
 
     @property
@@ -122,7 +130,9 @@ class Package:
         self._vars = {}
         self.raw_props = deepcopy(empty_raw_props)
         self.raw_vars = {}
-        self.filename = ''
+        self.expanded_props = deepcopy(empty_raw_props)
+        self.global_variables = {}
+        self._filename = ''
 
     def get_raw_property(self, prop):
         """Get a property value in its raw format, as it appears in the
@@ -135,19 +145,103 @@ class Package:
         """Get a variable in its raw format, as it appears in the file."""
         return self.raw_vars[var]
 
+    def get_variable(self, var):
+        """Get the value of a variable, substituting it if it has not been
+        used yet. Errors in the substitution name this package's file.
+
+        """
+        try:
+            return self.variables[var]
+        except UndefinedVarError as e:
+            raise UndefinedVarError(e.variable, self.filename)
+        except InfiniteRecursionError as e:
+            raise InfiniteRecursionError(e.variable, self.filename)
+
+    def expand_property(self, prop):
+        """Get a property value with its variables substituted. The flag
+        properties are substituted the first time they are asked for.
+
+        """
+        if prop not in self.expanded_props:
+            if self.header_only:
+                return self.raw_props[prop]
+            try:
+                self.expanded_props[prop] = substitute(self.raw_props[prop],
+                        self.variables, self.global_variables)
+            except UndefinedVarError as e:
+                raise UndefinedVarError(e.variable, self.filename)
+            except InfiniteRecursionError as e:
+                raise InfiniteRecursionError(e.variable, self.filename)
+        return self.expanded_props[prop]
+
     def sanity_check(self):
         return True
 
-    def load_from_pc_file(self, filename, global_variables):
+    def names_used(self):
+        """Get the names of the variables that the package's variables and
+        properties use or define. A global variable with any of these names
+        changes the package.
+
+        """
+        result = set(self.raw_vars)
+        for value in chain(self.raw_vars.values(), self.raw_props.values()):
+            result.update(get_all_substitutions(value))
+        return result
+
+    def with_globals(self, global_variables, filename=None):
+        """Get a copy of this package evaluated with a different set of
+        global variables (e.g. with another --define-variable prefix=...),
+        without reading the file again. The variables and properties are
+        substituted again from their raw values. The copy may also be given
+        the name of another file with identical contents.
+
+        """
+        pkg = copy(self)
+        if filename is not None:
+            pkg._filename = filename
+        pkg.variables = Variables(self.raw_vars, global_variables)
+        pkg._process_props(global_variables)
+        return pkg
+
+    def with_flags_for(self, global_variables, filename=None):
+        """Get a copy of this package with its Cflags and Libs processed
+        again for a different set of global variables, e.g. with another
+        pc_sysrootdir. The other properties and the variables are shared
+        with this package, so the global variables must not differ in any
+        variable the file substitutes. The copy may also be given the name
+        of another file with identical contents.
+
+        """
+        pkg = copy(self)
+        if filename is not None:
+            pkg._filename = filename
+        pkg.global_variables = global_variables
+        pkg.expanded_props = dict(self.expanded_props)
+        pkg.properties = LazyProperties(pkg, global_variables)
+        for key in self.properties.loaded_keys():
+            if key not in FLAG_PROPERTIES:
+                pkg.properties[key] = self.properties[key]
+        return pkg
+
+    def load_from_pc_file(self, filename, global_variables,
+                          header_only=False):
         """Load data from a package config file and process it."""
+        self.header_only = header_only
+        if header_only:
+            needed = HEADER_PROPERTIES
+        else:
+            needed = None
         self.raw_vars, self.variables, \
-                self.raw_props = read_pc_file(filename, global_variables)
+                self.raw_props = read_pc_file(filename, global_variables,
+                                              needed)
         self._filename = filename
         self._process_props(global_variables)
 
     def _process_props(self, global_variables):
-        # Processing of file data
-        props = self.raw_props
+        # Processing of file data. The raw properties are kept so that the
+        # package can be evaluated again with other global variables (see
+        # with_globals()).
+        self.global_variables = global_variables
 
         # May need to reset the prefix variable
         if sys.platform == 'win32' and \
@@ -169,13 +263,19 @@ class Package:
 {1}'.format(Options().get_option('prefix_variable'),
             self.variables[Options().get_option('prefix_variable')]))
 
-        # Perform substitutions
-        for key in props:
-            props[key] = substitute(props[key], self.variables,
+        # Perform substitutions. The Cflags, Libs and Libs.private are
+        # substituted when first used (see expand_property()), so a variable
+        # that only they use is not needed to read the other properties.
+        props = {}
+        for key in self.raw_props:
+            if key not in HEADER_PROPERTIES:
+                continue
+            props[key] = substitute(self.raw_props[key], self.variables,
                     global_variables)
+        self.expanded_props = props
 
-        # Parse the data
-        self.properties = deepcopy(empty_processed_props)
+        # Parse the data. The flag properties are parsed when first used.
+        self.properties = LazyProperties(self, global_variables)
         self.properties['name'] = props['name']
         if props['description']:
             self.properties['description'] = props['description']
@@ -191,14 +291,12 @@ class Package:
             self.properties['requires']
         self.properties['conflicts'] = \
                 parse_package_spec_list(props['conflicts'])
-        self._parse_cflags(props['cflags'], global_variables)
-        self._parse_libs(props['libs'], global_variables)
-        self._parse_libs(props['libs.private'], global_variables, dest='private.')
+        self.properties['provides'] = \
+                parse_package_spec_list(props['provides'])
 
     def _parse_cflags(self, value, global_variables):
-        flags = shlex.split(value, posix=False)
-        for flag in flags:
-            if flag.startswith('-I'):
+        for kind, flag in split_cflags(value):
+            if kind == INCLUDE_DIR:
                 if flag[2:] not in \
                         Options().get_option('forbidden_cflags'):
                     # Prepend pc_sysrootdir if necessary
@@ -229,17 +327,11 @@ class Package:
 
     def _parse_libs(self, value, global_variables, dest=''):
         # Parse lib flags
-        libs = shlex.split(value)
-        skip_next = False
-        for ii, lib in enumerate(libs):
-            if skip_next:
-                # Possibly skip an entry that was eaten by a -framework
-                skip_next = False
-                continue
-            if lib.startswith('-l'):
+        for kind, lib in split_libs(value):
+            if kind == LIB:
                 self.properties[dest + 'libs'].append(lib[2:].strip() + \
                         self.lib_suffix)
-            elif lib.startswith('-L'):
+            elif kind == LIB_PATH:
                 if lib[2:] not in \
                         Options().get_option('forbidden_libdirs'):
                     # Prepend pc_sysrootdir if necessary
@@ -263,14 +355,86 @@ class Package:
                         else:
                             libpath = libpath.replace('\\', '/')
                     self.properties[dest + 'libpaths'].append(libpath)
-            elif lib.startswith('-framework'):
-                self.properties[dest + 'otherlibs']. \
-                        append(libs[ii + 1].strip() + self.lib_suffix)
-                skip_next = True
             else:
+                # Including the flag following a -framework
                 self.properties[dest + 'otherlibs'].append(lib.strip() + \
                         self.lib_suffix)
 
 
-# vim: tw=79
+##############################################################################
+# LazyProperties class
+
+# The raw property that each flag property is parsed from, and the prefix
+# of the flag property's name
+_FLAG_SOURCES = {'include_dirs': ('cflags', None),
+                 'other_cflags': ('cflags', None),
+                 'libs': ('libs', ''),
+                 'libpaths': ('libs', ''),
+                 'otherlibs': ('libs', ''),
+                 'private.libs': ('libs.private', 'private.'),
+                 'private.libpaths': ('libs.private', 'private.'),
+                 'private.otherlibs': ('libs.private', 'private.')}
+
+
+class LazyProperties(MutableMapping):
+    """The processed properties of a package.
+
+    The flag properties are substituted and parsed from the package's
+    Cflags, Libs or Libs.private the first time one of them is used, so a
+    package whose Cflags are never used never has them split, and a
+    variable used only in them need not be defined. The other properties are
+    set by the package when it is loaded.
+
+    """
+    def __init__(self, package, global_variables):
+        self._package = package
+        self._globals = global_variables
+        self._values = dict((key, deepcopy(empty_processed_props[key])) \
+                for key in empty_processed_props if key not in _FLAG_SOURCES)
+
+    def __getitem__(self, key):
+        if key not in self._values and key in _FLAG_SOURCES:
+            self._parse(_FLAG_SOURCES[key][0])
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
 
+    def __delitem__(self, key):
+        del self._values[key]
+
+    def __iter__(self):
+        for key in empty_processed_props:
+            yield key
+        for key in self._values:
+            if key not in empty_processed_props:
+                yield key
+
+    def __len__(self):
+        return len(set(empty_processed_props) | set(self._values))
+
+    def loaded_keys(self):
+        """Get the keys of the properties that have been set or parsed,
+        which does not include flag properties that have not been used.
+
+        """
+        return list(self._values)
+
+    def _parse(self, source):
+        # Parse all the flag properties that come from one raw property
+        for key in _FLAG_SOURCES:
+            if _FLAG_SOURCES[key][0] == source:
+                self._values[key] = []
+                dest = _FLAG_SOURCES[key][1]
+        if self._package.header_only:
+            return
+        ErrorPrinter().debug_print('Parsing %s of %s',
+                                   (source, self._package.filename))
+        value = self._package.expand_property(source)
+        if source == 'cflags':
+            self._package._parse_cflags(value, self._globals)
+        else:
+            self._package._parse_libs(value, self._globals, dest=dest)
+
+
+# vim: tw=79
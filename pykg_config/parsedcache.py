@@ -0,0 +1,195 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: parsedcache.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Persistent cache of parsed pkg-config files.
+
+Parsing a pkg-config file produces its raw variables and raw properties.
+These are stored in a cache directory, one file per entry, keyed by the
+path of the pkg-config file, its identity and size and modification time
+(so any change to the file invalidates the entry) and the set of
+properties read. The variables are substituted when used, so the entries
+do not depend on the global variables.
+An entry that is missing, unreadable or does not match is simply parsed
+again.
+
+Entries are written atomically by renaming a complete temporary file into
+place, so concurrent processes never see a partial entry. Reading an entry
+updates its modification time. Every so many writes, the number of entries
+is checked; if there are too many, the least recently used are removed to
+leave room for more before the next check.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import hashlib
+import json
+import random
+from os import getpid, makedirs, remove, replace, scandir, stat, utime
+from os.path import abspath, join
+import time
+
+from pykg_config.dirindex import RACY_INTERVAL
+from pykg_config.errorprinter import ErrorPrinter
+
+# Version of the entry format. Entries with a different version are ignored.
+CACHE_FORMAT = 2
+# Name of the directory within the cache directory holding the entries.
+PARSED_DIRNAME = 'parsed'
+# Default maximum number of entries.
+MAX_ENTRIES = 4096
+
+##############################################################################
+# ParsedCache object
+
+class ParsedCache:
+    """Parsed pkg-config files stored in a directory."""
+    def __init__(self, directory, max_entries=MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        # Number of writes between checks for too many entries. Checking
+        # lists the whole directory, so doing it after every write would
+        # make filling the cache quadratic.
+        self.evict_interval = max(1, max_entries // 4)
+        # Many processes write only a few entries, so each starts at a
+        # random point in the interval. The writes of all processes together
+        # are then checked about once per interval.
+        self._writes = random.randrange(self.evict_interval)
+
+    @classmethod
+    def in_cache_dir(cls, cache_dir):
+        """Get the cache stored in the given cache directory."""
+        return cls(join(cache_dir, PARSED_DIRNAME))
+
+    def identity(self, filename):
+        """Get the stat() result identifying the current contents of a file,
+        or None if the file cannot be cached. Take it before reading the
+        file.
+
+        """
+        try:
+            return stat(filename)
+        except OSError:
+            return None
+
+    def get(self, filename, st, properties=None):
+        """Get the stored (raw variables, properties) from parsing a file
+        with the given identity and properties (see pcfile.read_pc_file()),
+        or None.
+
+        """
+        key = _key(filename, st, properties)
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            if entry['format'] != CACHE_FORMAT or entry['key'] != key:
+                return None
+            result = entry['raw_vars'], entry['props']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        try:
+            # Mark the entry as recently used
+            utime(path)
+        except OSError:
+            pass
+        ErrorPrinter().debug_print('Using cached parse of %s', (filename))
+        return result
+
+    def set(self, filename, st, properties, raw_vars, props):
+        """Store the raw variables and properties parsed from a file that
+        had the given identity before it was read. Failure to store them is
+        not an error.
+
+        """
+        if st is None or time.time_ns() - st.st_mtime_ns <= RACY_INTERVAL:
+            # A change within the same timestamp tick could go unnoticed
+            return
+        key = _key(filename, st, properties)
+        path = self._entry_path(key)
+        tmp_name = '{0}.{1}.tmp'.format(path, getpid())
+        try:
+            makedirs(self.directory, exist_ok=True)
+            with open(tmp_name, 'w') as f:
+                json.dump({'format': CACHE_FORMAT, 'key': key,
+                           'raw_vars': raw_vars, 'props': props}, f)
+            replace(tmp_name, path)
+        except (IOError, OSError) as e:
+            ErrorPrinter().debug_print('Failed to cache parse of %s: %s',
+                                       (filename, e))
+            try:
+                remove(tmp_name)
+            except OSError:
+                pass
+            return
+        self._writes += 1
+        if self._writes >= self.evict_interval:
+            self._writes = 0
+            self._evict()
+
+    def _entry_path(self, key):
+        digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+        return join(self.directory, digest + '.json')
+
+    def _evict(self):
+        # If there are too many entries, remove the least recently used,
+        # leaving room for the writes until the next check
+        try:
+            with scandir(self.directory) as entries:
+                files = [(e.stat().st_mtime_ns, e.path) for e in entries
+                         if e.name.endswith('.json')]
+        except OSError:
+            return
+        if len(files) <= self.max_entries:
+            return
+        keep = max(0, self.max_entries - self.evict_interval)
+        files.sort()
+        for mtime, path in files[:len(files) - keep]:
+            try:
+                remove(path)
+            except OSError:
+                # Possibly removed by another process
+                pass
+
+
+##############################################################################
+# Private functions
+
+def _key(filename, st, properties):
+    # The key of an entry, as stored in it
+    if properties is not None:
+        properties = sorted(properties)
+    return [abspath(filename), st.st_dev, st.st_ino, st.st_size,
+            st.st_mtime_ns, properties]
+
+
+# vim: tw=79
@@ -0,0 +1,202 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: pcarchive.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Sources of pkg-config files other than directories.
+
+A search path entry may be a zip archive, or a directory within one
+(e.g. toolchain.zip/lib/pkgconfig). The archive's central directory is
+read once to find the .pc files in it, and their contents are read
+directly from the archive without extracting them. Files in an archive
+are named by joining the archive's path and the member's path, as if the
+archive were a directory.
+
+A PcRegistry holds the contents of pkg-config files in memory, for
+packages generated by a program using pykg-config. It is named by a path
+that cannot exist in the file system.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import locale
+from os import sep
+import posixpath
+import weakref
+import zipfile
+
+from pykg_config.errorprinter import ErrorPrinter
+
+# Open archives, by path
+_archives = {}
+# Registries in use, by path
+_registries = weakref.WeakValueDictionary()
+
+##############################################################################
+# PcArchive object
+
+class PcArchive:
+    """The .pc files in a zip archive.
+
+    Directories within the archive are named using / as the separator,
+    with '' being the top of the archive.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        # The .pc files in each directory of the archive, in the order of the
+        # central directory.
+        self._dirs = {}
+        self._members = set()
+        for info in self._zip.infolist():
+            if info.is_dir() or not info.filename.endswith('.pc') or \
+                    info.filename in self._members:
+                continue
+            self._members.add(info.filename)
+            inner, filename = posixpath.split(info.filename)
+            self._dirs.setdefault(inner, []).append(filename)
+
+    def has_dir(self, inner):
+        """Check if there are any .pc files in a directory of the archive."""
+        return inner in self._dirs
+
+    def pc_files(self, inner):
+        """Get the names of the .pc files in a directory of the archive."""
+        return self._dirs.get(inner, [])
+
+    def has_member(self, member):
+        return member in self._members
+
+    def contains(self, inner, filename):
+        return self.has_member(posixpath.join(inner, filename))
+
+    def read(self, member):
+        """Read the contents of a member of the archive as text."""
+        data = self._zip.read(member)
+        return data.decode(locale.getpreferredencoding(False))
+
+    def fields(self, member):
+        # Archive members are always text
+        return None
+
+
+##############################################################################
+# PcRegistry object
+
+class PcRegistry:
+    """pkg-config files held in memory.
+
+    It has a single directory, ''. Each file is stored either as text or
+    as dictionaries of the raw values of its variables and properties.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        # File name to text or (variables, properties), in order of
+        # registration
+        self._files = {}
+        _registries[path] = self
+
+    def add(self, filename, text=None, variables=None, properties=None):
+        if text is None:
+            self._files[filename] = (dict(variables or {}),
+                                     dict(properties or {}))
+        else:
+            self._files[filename] = text
+
+    def remove(self, filename):
+        del self._files[filename]
+
+    def has_dir(self, inner):
+        return inner == ''
+
+    def pc_files(self, inner):
+        return list(self._files)
+
+    def has_member(self, member):
+        return member in self._files
+
+    def contains(self, inner, filename):
+        return self.has_member(filename)
+
+    def read(self, member):
+        return self._files[member]
+
+    def fields(self, member):
+        """Get the variables and properties of a file registered as
+        dictionaries, or None if it was registered as text.
+
+        """
+        value = self._files[member]
+        if isinstance(value, tuple):
+            return value
+        return None
+
+
+##############################################################################
+# Public functions
+
+def open_archive(path):
+    """Get the archive at path, opening it if it has not been opened
+    before. Returns None if path is not a zip archive.
+
+    """
+    if path in _archives:
+        return _archives[path]
+    archive = None
+    if zipfile.is_zipfile(path):
+        try:
+            archive = PcArchive(path)
+            ErrorPrinter().debug_print('Opened archive %s', (path))
+        except (IOError, OSError, zipfile.BadZipfile) as e:
+            ErrorPrinter().debug_print('Failed to open archive %s: %s',
+                                       (path, e))
+    _archives[path] = archive
+    return archive
+
+
+def find_member(filename):
+    """Find the archive or registry containing a file named using its path.
+    Returns the archive or registry and the name of the member, or None.
+
+    """
+    for sources in (_archives, _registries):
+        for path, source in list(sources.items()):
+            if source is not None and filename.startswith(path + sep):
+                member = filename[len(path) + 1:].replace(sep, '/')
+                if source.has_member(member):
+                    return source, member
+    return None
+
+
+# vim: tw=79
+
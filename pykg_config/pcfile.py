@@ -43,7 +43,10 @@ import re
 
 from pykg_config.errorprinter import ErrorPrinter
 from pykg_config.exceptions import ParseError
-from pykg_config.substitute import substitute
+from pykg_config.options import Options
+from pykg_config.parsedcache import ParsedCache
+from pykg_config.pcarchive import find_member
+from pykg_config.substitute import substitute, Variables
 from pykg_config.props import empty_raw_props
 
 # Constants
@@ -104,85 +107,235 @@ class TrailingContinuationCharError(ParseError):
 ##############################################################################
 # Public functions
 
-def read_pc_file(filename, global_variables):
+def read_pc_file(filename, global_variables, properties=None):
     """Read and parse it into two dictionaries (variables and properties).
 
-    Returns variables and properties.
+    The variables are substituted when they are first used (see
+    substitute.Variables). If a list of (lower-case) property names is
+    given, only those properties are needed: the file is not parsed beyond
+    the point where all of them have been found.
+
+    Returns raw variables, variables and properties.
 
     """
     ErrorPrinter().set_variable('filename', filename)
+    cache = _parsed_cache(filename)
+    if cache is not None:
+        st = cache.identity(filename)
+        if st is not None:
+            result = cache.get(filename, st, properties)
+            if result is not None:
+                raw_vars, props = result
+                return raw_vars, Variables(raw_vars, global_variables), props
     ErrorPrinter().debug_print('Parsing %(filename)')
-    pcfile = open(filename, 'r')
-    lines = pcfile.readlines()
-    if not lines:
+    text, fields = read_text(filename)
+    if fields is not None:
+        return parse_pc_fields(fields[0], fields[1], global_variables)
+    if properties is not None:
+        result = parse_pc_text_properties(text, global_variables, properties)
+    else:
+        result = parse_pc_text(text, global_variables)
+    if cache is not None:
+        cache.set(filename, st, properties, result[0], result[2])
+    return result
+
+
+def read_pc_file_version(filename, global_variables):
+    """Read only the value of the Version property of a pkg-config file,
+    with variables substituted. The file is not parsed beyond the line
+    holding the version.
+
+    Returns the version string, which is empty if the file has none.
+
+    """
+    ErrorPrinter().set_variable('filename', filename)
+    ErrorPrinter().debug_print('Reading version from %(filename)')
+    text, fields = read_text(filename)
+    if fields is not None:
+        raw_vars, vars, props = parse_pc_fields(fields[0], fields[1],
+                                                global_variables)
+    else:
+        raw_vars = {}
+        props = empty_raw_props.copy()
+        seen_props = []
+        for type, key, value in tokenize_pc(text):
+            add_value(key, value, type, raw_vars, props, seen_props)
+            if props['version']:
+                break
+        vars = Variables(raw_vars, global_variables)
+    return substitute(props['version'], vars, global_variables)
+
+
+def read_text(filename):
+    """Read the text of a pkg-config file, which may be in an archive or
+    registered in memory. Raises EmptyPackageFileError if it is empty.
+
+    Returns the text and None, or None and the (variables, properties)
+    of a file registered as dictionaries.
+
+    """
+    member = find_member(filename)
+    if member is not None:
+        source, name = member
+        fields = source.fields(name)
+        if fields is not None:
+            return None, fields
+        text = source.read(name)
+    else:
+        with open(filename, 'r') as pcfile:
+            text = pcfile.read()
+    if not text:
         raise EmptyPackageFileError(filename)
-    raw_vars, vars, props = parse_pc_file_lines(lines, global_variables)
-    pcfile.close()
-    return raw_vars, vars, props
+    return text, None
 
 
-##############################################################################
-# Private functions
+def parse_pc_text(text, global_variables):
+    """Parse the text of a pkg-config file into two dictionaries (variables
+    and properties).
+
+    Returns raw variables, variables and properties.
+
+    """
+    raw_vars = {}
+    props = empty_raw_props.copy()
+    seen_props = []
+    for type, key, value in tokenize_pc(text):
+        add_value(key, value, type, raw_vars, props, seen_props)
+    return raw_vars, Variables(raw_vars, global_variables), props
+
+
+def parse_pc_text_properties(text, global_variables, properties):
+    """Parse the given (lower-case) properties from the text of a
+    pkg-config file, stopping once all of them have been found.
+
+    Returns raw variables, variables and properties.
 
-def parse_pc_file_lines(lines, globals):
-    # Parse all lines from a pkg-config file, building vars and props
-    # dictionaries.
+    """
     raw_vars = {}
-    vars = {}
     props = empty_raw_props.copy()
     seen_props = []
-    for line in merge_lines(lines, '\\'):
-        raw_vars, vars, props, seen_props = parse_line(strip_comments(line).strip(),
-                                                       raw_vars, vars, props,
-                                                       seen_props, globals)
+    remaining = set(properties)
+    for type, key, value in tokenize_pc(text):
+        add_value(key, value, type, raw_vars, props, seen_props)
+        if type == PROPERTY:
+            remaining.discard(key.lower())
+            if not remaining:
+                break
+    return raw_vars, Variables(raw_vars, global_variables), props
+
+
+def tokenize_pc(text):
+    """Split the text of a pkg-config file into its variables and
+    properties in a single pass.
+
+    A line ending in a backslash continues on the next line; the backslash
+    is replaced by a space unless it already follows a space or tab.
+    Everything from a # to the end of a (continued) line is a comment. Blank
+    and malformed lines are skipped. Raises TrailingContinuationCharError
+    if the file ends in a backslash.
+
+    Yields (type, key, value) tuples, where type is VARIABLE or PROPERTY.
+    The value of a property with no value is None.
+
+    """
+    for m in _definition_re.finditer(_join_continued(text)):
+        key, type, value = m.groups()
+        value = value.rstrip()
+        if type == ':':
+            yield PROPERTY, key, value or None
+        else:
+            yield VARIABLE, key, value
 
-    return raw_vars, vars, props
 
+def find_malformed_lines(text):
+    """Get the (continued) lines of the text of a pkg-config file that are
+    neither blank, a comment, nor a variable or property definition. The
+    parser skips such lines.
 
-def merge_lines(lines, cont_char):
-    # Merge any lines ending with the given character with the following line.
-    # Return a list of lines. Raises TrailingContinuationCharError if the
-    # final line has the continuation character.
-    if lines[-1][-1] == cont_char:
-        raise TrailingContinuationCharError(line)
+    """
     result = []
-    ii = 0
-    while ii < len(lines):
-        new_line = lines[ii].rstrip()
-        if new_line == '':
-            ii += 1
-            continue
-        while new_line[-1] == cont_char:
-            # Drop the \n and the continuation char
-            new_line = new_line[:-2] + ' '
-            ii += 1
-            new_line += lines[ii].rstrip()
-        result.append(new_line)
-        ii += 1
+    for line in _join_continued(text).splitlines():
+        line = line.strip()
+        if line and not line.startswith('#') and \
+                not _definition_re.match(line):
+            result.append(line)
     return result
 
 
-def parse_line(line, raw_vars, vars, props, seen_props, globals):
-    # Parse a single line from the file, adding its value to the props or vars
-    # dictionary as appropriate.
-    if not line:
-        return raw_vars, vars, props, seen_props
-    key, value, type = split_pc_file_line(line)
+def parse_pc_fields(variables, properties, global_variables):
+    """Parse variables and properties given as dictionaries of their raw
+    (unsubstituted) values, in the same way as the lines of a file.
+    Variables are defined in the dictionary's order.
+
+    Returns raw variables, variables and properties.
+
+    """
+    raw_vars = {}
+    props = empty_raw_props.copy()
+    seen_props = []
+    for key in variables:
+        add_value(key, variables[key], VARIABLE, raw_vars, props, seen_props)
+    for key in properties:
+        add_value(key, properties[key], PROPERTY, raw_vars, props, seen_props)
+    return raw_vars, Variables(raw_vars, global_variables), props
+
+
+##############################################################################
+# Private functions
+
+# A line defining a variable or property: the key, the type (= or :), and
+# the value up to any comment. Other lines do not match.
+_definition_re = re.compile(r'^[^\S\n]*([\w.]+)([:=])[^\S\n]*([^#\n]*)',
+                            re.M | re.U)
+# A continuation character followed by whitespace and the end of its line,
+# with the preceding character if it is a space or tab.
+_continuation_re = re.compile(r'([ \t]?)\\[^\S\n]*\n')
+# The persistent caches of parsed files, by cache directory
+_parsed_caches = {}
+
+
+def _parsed_cache(filename):
+    # The persistent cache of parsed files to use for a file, or None.
+    # Files in archives or in memory are not cached.
+    cache_dir = Options().get_option('cache_dir')
+    if not cache_dir or find_member(filename) is not None:
+        return None
+    cache = _parsed_caches.get(cache_dir)
+    if cache is None:
+        cache = ParsedCache.in_cache_dir(cache_dir)
+        _parsed_caches[cache_dir] = cache
+    return cache
+
+
+def _join_continued(text):
+    # Join lines ending in a backslash to the following line
+    if '\\' not in text:
+        return text
+    end = text.rstrip(' \t\r\f\v')
+    if end.endswith('\\'):
+        raise TrailingContinuationCharError(end[end.rfind('\n') + 1:-1])
+    # Handle the usual forms without a regex
+    text = text.replace(' \\\n', ' ').replace('\t\\\n', '\t'). \
+            replace('\\\n', ' ')
+    if '\\' in text:
+        text = _continuation_re.sub(_join_lines, text)
+    return text
+
+
+def _join_lines(m):
+    # Replace a continuation with a space, unless it follows whitespace
+    return m.group(1) or ' '
+
+
+def add_value(key, value, type, raw_vars, props, seen_props):
+    # Add a variable or property to the raw_vars or props dictionary as
+    # appropriate. Variables are substituted when they are used.
     # Check first if it's one of the known keys.
     if type == VARIABLE:
-        # Perform substitution using variables found so far and global
-        # variables, then store the result.
-        if key in vars:
+        if key in raw_vars:
             raise MultiplyDefinedValueError(key)
-        if key in globals:
-            ErrorPrinter().debug_print('Adding %s -> %s to vars from globals',
-                                       (key, value))
-            raw_vars[key] = value.strip ()
-            vars[key] = substitute (globals[key], vars, globals)
-        else:
-            ErrorPrinter().debug_print('Adding %s -> %s to vars', (key, value))
-            raw_vars[key] = value.strip ()
-            vars[key] = substitute (value.strip(), vars, globals)
+        ErrorPrinter().debug_print('Adding %s -> %s to vars', (key, value))
+        raw_vars[key] = value.strip()
     elif type == PROPERTY:
         if key in seen_props:
             raise MultiplyDefinedValueError(key)
@@ -201,38 +354,7 @@ def parse_line(line, raw_vars, vars, props, seen_props, globals):
     else:
         # Probably a malformed line. Ignore it.
         pass
-    return raw_vars, vars, props, seen_props
-
-
-def strip_comments(line):
-    # Strip comments from a line, returning the uncommented part or a blank
-    # string if the whole line was a comment.
-    commentStart = line.find('#')
-    if commentStart == -1:
-        return line
-    else:
-        return line[:commentStart]
-
-
-property_re = re.compile('(?P<key>[\w.]+):\s*(?P<value>.+)?', re.U)
-variable_re = re.compile('(?P<var>[\w.]+)=\s*(?P<value>.+)?', re.U)
-def split_pc_file_line(line):
-    # Split a line into key and value, and determine if it is a property or a
-    # variable.
-    m = property_re.match(line)
-    if m is not None:
-        return m.group('key'), m.group('value'), PROPERTY
-
-    m = variable_re.match(line)
-    if m is not None:
-        if m.group('value') is None:
-            return m.group('var'), '', VARIABLE
-        else:
-            return m.group('var'), m.group('value'), VARIABLE
-
-    # Gloss over malformed lines (that's what pkg-config does).
-    ErrorPrinter().debug_print('Malformed line: {0}'.format(line))
-    return None, None, None
+    return raw_vars, props, seen_props
 
 
 # vim: tw=79
@@ -0,0 +1,148 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: pkgcache.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Sharing of parsed packages between searchers.
+
+When the same packages are resolved for several configurations (e.g. for
+several sysroots), many of the pkg-config files found are byte-for-byte
+identical copies of each other. A PackageCache shared by the searchers of
+all configurations parses each file, and each distinct file content, once.
+Each searcher receives a copy of the parsed package with only its Cflags
+and Libs processed again, as those depend on global variables such as
+pc_sysrootdir that are not substituted into the file. If the global
+variables the file uses differ (e.g. another --define-variable prefix=...),
+the copy is evaluated again from the raw variables and properties.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import hashlib
+from os.path import dirname
+import sys
+
+from pykg_config.errorprinter import ErrorPrinter
+from pykg_config.package import Package
+from pykg_config.pcarchive import find_member
+
+##############################################################################
+# PackageCache object
+
+class PackageCache:
+    """Parsed packages, keyed by file name and by file contents.
+
+    A file that changes while the cache is in use must be forgotten (see
+    forget()), or the package parsed from its old contents will be used.
+
+    """
+    def __init__(self):
+        self._packages = {}
+        self._by_filename = {}
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, pcfile, globals, header_only=False):
+        """Get the package in a pkg-config file, parsing it only if a file
+        with the same name or contents has not been parsed before. A
+        package parsed with different values of the global variables it
+        uses is evaluated again with the new values. If header_only is
+        True, only the header of the package is read (see Package).
+
+        """
+        pkg = self._by_filename.get((pcfile, header_only))
+        if pkg is not None:
+            self.hits += 1
+            return _evaluate(pkg, globals, pcfile)
+        data = _read_bytes(pcfile)
+        if data is None:
+            # Files given as fields cannot be compared
+            return Package(pcfile, globals, header_only=header_only)
+        key = (hashlib.sha1(data).digest(), header_only)
+        if sys.platform == 'win32':
+            # The prefix variable may be set from the location of the file
+            key += (dirname(pcfile),)
+        pkg = self._packages.get(key)
+        if pkg is None:
+            self.misses += 1
+            pkg = Package(pcfile, globals, header_only=header_only)
+            self._packages[key] = pkg
+            self._by_filename[(pcfile, header_only)] = pkg
+            return pkg
+        self.hits += 1
+        self._by_filename[(pcfile, header_only)] = pkg
+        return _evaluate(pkg, globals, pcfile)
+
+    def forget(self, pcfile=None):
+        """Forget the package parsed from a file, or from every file if no
+        file is given, so that the file is read again when next loaded.
+        Packages parsed from the same contents are still shared.
+
+        """
+        if pcfile is None:
+            self._by_filename.clear()
+            return
+        for header_only in (False, True):
+            self._by_filename.pop((pcfile, header_only), None)
+
+    def clear(self):
+        self._packages.clear()
+        self._by_filename.clear()
+
+
+##############################################################################
+# Private functions
+
+def _evaluate(pkg, globals, pcfile):
+    # Get a parsed package for a file with the given global variables
+    ErrorPrinter().debug_print('Reusing parsed %s for %s',
+                               (pkg.filename, pcfile))
+    for name in pkg.names_used():
+        if globals.get(name) != pkg.global_variables.get(name):
+            return pkg.with_globals(globals, pcfile)
+    return pkg.with_flags_for(globals, pcfile)
+
+
+def _read_bytes(pcfile):
+    # Read the contents of a file, which may be in an archive or a registry.
+    # Returns None for registered files given as fields rather than text.
+    member = find_member(pcfile)
+    if member is None:
+        with open(pcfile, 'rb') as f:
+            return f.read()
+    source, name = member
+    if source.fields(name) is not None:
+        return None
+    return source.read(name).encode('utf-8')
+
+
+# vim: tw=79
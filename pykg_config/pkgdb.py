@@ -0,0 +1,345 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: pkgdb.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Queryable database of all installed packages.
+
+For tools that ask questions about every installed package, such as which
+packages have at least a given version, which packages link a given
+library, or which package names match a pattern. The parsed contents of
+every .pc file known to a PkgSearcher are stored in an SQLite database,
+along with the stat() information of each file and a fingerprint of the
+global variables they were evaluated with. Updating the database only
+parses files that are new or have changed, or all files if the global
+variables have changed, and queries are answered from the database without
+parsing any files.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import hashlib
+import json
+from os import stat
+import sqlite3
+import time
+
+from pykg_config.dirindex import RACY_INTERVAL
+from pykg_config.errorprinter import ErrorPrinter
+from pykg_config.exceptions import PykgConfigError
+from pykg_config.operators import operator_to_text, text_to_operator, \
+        LESS_THAN, LESS_THAN_EQUAL, EQUAL, NOT_EQUAL, GREATER_THAN_EQUAL, \
+        GREATER_THAN, ALWAYS_MATCH
+from pykg_config.package import Package
+from pykg_config.pcarchive import PcArchive, find_member
+from pykg_config.version import Version
+
+# Version of the database schema. A database with a different version is
+# rebuilt.
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL);
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    package TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER,
+    name TEXT, description TEXT, version TEXT, url TEXT,
+    error TEXT);
+CREATE INDEX files_package ON files (package, priority);
+CREATE TABLE requires (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    dependency TEXT NOT NULL,
+    operator TEXT NOT NULL,
+    version TEXT NOT NULL);
+CREATE INDEX requires_file ON requires (file_id);
+CREATE INDEX requires_dependency ON requires (dependency);
+CREATE TABLE libs (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    lib TEXT NOT NULL,
+    private INTEGER NOT NULL);
+CREATE INDEX libs_file ON libs (file_id);
+CREATE INDEX libs_lib ON libs (lib);
+'''
+
+##############################################################################
+# PackageDatabase object
+
+class PackageDatabase:
+    """Database of the packages known to a PkgSearcher.
+
+    Call update() to bring the database up to date with the search
+    directories before querying it. Queries only consider the
+    highest-priority file of each package unless stated otherwise.
+
+    """
+    def __init__(self, filename, searcher):
+        self.filename = filename
+        self.searcher = searcher
+        self._db = sqlite3.connect(filename)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.create_function('pc_version_matches', 3,
+                                 _version_matches)
+        schema_version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if schema_version != SCHEMA_VERSION:
+            self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def update(self):
+        """Parse all new and changed .pc files and remove the entries of
+        files that are no longer found.
+
+        Returns the number of files that were parsed.
+
+        """
+        parsed = 0
+        with self._db:
+            # The stored packages were evaluated with the global variables,
+            # so they are all parsed again if those have changed
+            fingerprint = _globals_fingerprint(self.searcher.globals)
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?',
+                                   ('globals',)).fetchone()
+            if row is None or row[0] != fingerprint:
+                ErrorPrinter().debug_print('Global variables changed, '
+                                           'clearing %s', (self.filename))
+                self._db.execute('DELETE FROM files')
+                self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                 ('globals', fingerprint))
+            stored = {}
+            for row in self._db.execute('SELECT id, path, package, '
+                                        'priority, dev, ino, size, mtime '
+                                        'FROM files'):
+                stored[row[1]] = row
+            for pkgname, pcfiles in self.searcher.known_pcfiles(rescan=True):
+                for priority, pcfile in enumerate(pcfiles):
+                    identity = _file_identity(pcfile)
+                    row = stored.pop(pcfile, None)
+                    if row is not None and identity is not None and \
+                            row[2:] == (pkgname, priority) + identity:
+                        continue
+                    if row is not None:
+                        self._db.execute('DELETE FROM files WHERE id = ?',
+                                         (row[0],))
+                    self._add_file(pkgname, priority, pcfile, identity)
+                    parsed += 1
+            for row in stored.values():
+                self._db.execute('DELETE FROM files WHERE id = ?', (row[0],))
+        ErrorPrinter().debug_print('Parsed %d files into %s',
+                                   (parsed, self.filename))
+        return parsed
+
+    def packages_matching(self, pattern):
+        """Get the names of all packages matching a glob-style pattern
+        (e.g. 'gtk*'), in sorted order.
+
+        """
+        return [row[0] for row in self._db.execute(
+            'SELECT package FROM files WHERE priority = 0 AND package GLOB ? '
+            'ORDER BY package', (pattern,))]
+
+    def packages_with_version(self, operator, version):
+        """Get the packages with a version meeting the given comparison
+        (e.g. '>=', '2.4'), as a list of (package, version) pairs.
+
+        """
+        return self._db.execute(
+            'SELECT package, version FROM files WHERE priority = 0 AND '
+            'error IS NULL AND pc_version_matches(version, ?, ?) '
+            'ORDER BY package', (operator, version)).fetchall()
+
+    def library_providers(self, lib, include_private=False):
+        """Get the names of the packages that link a library (given as it
+        would be to -l).
+
+        """
+        query = 'SELECT DISTINCT package FROM files JOIN libs ' \
+                'ON libs.file_id = files.id WHERE priority = 0 AND lib = ?'
+        if not include_private:
+            query += ' AND private = 0'
+        return [row[0] for row in self._db.execute(query + ' ORDER BY package',
+                                                   (lib,))]
+
+    def dependents(self, pkgname, kinds=('requires', 'requires.private')):
+        """Get the names of the packages that require a package."""
+        query = 'SELECT DISTINCT package FROM files JOIN requires ' \
+                'ON requires.file_id = files.id WHERE priority = 0 AND ' \
+                'dependency = ? AND kind IN ({0}) ORDER BY package'.format(
+                        ', '.join('?' * len(kinds)))
+        return [row[0] for row in self._db.execute(query,
+                                                   (pkgname,) + tuple(kinds))]
+
+    def requires(self, pkgname):
+        """Get the requirements of a package, as a list of (kind,
+        dependency, operator, version) tuples.
+
+        """
+        return self._db.execute(
+            'SELECT kind, dependency, operator, requires.version FROM files '
+            'JOIN requires ON requires.file_id = files.id WHERE priority = 0 '
+            'AND package = ? ORDER BY requires.rowid', (pkgname,)).fetchall()
+
+    def header(self, pkgname):
+        """Get the (name, description, version, url) of a package, or None
+        if the package is not known or could not be parsed.
+
+        """
+        return self._db.execute(
+            'SELECT name, description, version, url FROM files WHERE '
+            'priority = 0 AND package = ? AND error IS NULL',
+            (pkgname,)).fetchone()
+
+    def errors(self):
+        """Get the files that could not be parsed, as a list of (path,
+        error) pairs.
+
+        """
+        return self._db.execute('SELECT path, error FROM files WHERE '
+                                'error IS NOT NULL ORDER BY path').fetchall()
+
+    def _create_schema(self):
+        with self._db:
+            for table in ('requires', 'libs', 'files', 'meta'):
+                self._db.execute('DROP TABLE IF EXISTS {0}'.format(table))
+            self._db.executescript(SCHEMA)
+            self._db.execute('PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
+
+    def _add_file(self, pkgname, priority, pcfile, identity):
+        if identity is None:
+            identity = (None, None, None, None)
+        try:
+            pkg = Package(pcfile, self.searcher.globals)
+            # The flags are substituted when first used
+            libs = pkg.properties['libs']
+            private_libs = pkg.properties['private.libs']
+        except (IOError, PykgConfigError) as e:
+            self._db.execute('INSERT INTO files (path, package, priority, dev, '
+                             'ino, size, mtime, error) VALUES (?, ?, ?, ?, ?, '
+                             '?, ?, ?)', (pcfile, pkgname, priority) +
+                             identity + ('{0}: {1}'.format(
+                                 type(e).__name__, e),))
+            return
+        props = pkg.properties
+        file_id = self._db.execute('INSERT INTO files (path, package, '
+                'priority, dev, ino, size, mtime, name, description, version, '
+                'url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (pcfile, pkgname, priority) + identity + (props['name'],
+                props['description'], str(props['version']),
+                props['url'])).lastrowid
+        requires = props['requires']
+        # requires.private includes requires
+        private = props['requires.private'][:len(props['requires.private']) -
+                                            len(requires)]
+        for kind, deps in (('requires', requires),
+                           ('requires.private', private),
+                           ('conflicts', props['conflicts'])):
+            self._db.executemany('INSERT INTO requires VALUES (?, ?, ?, ?, ?)',
+                    [(file_id, kind, dep.name,
+                      _operator_text(dep.operator), str(dep.version))
+                     for dep in deps])
+        self._db.executemany('INSERT INTO libs VALUES (?, ?, 0)',
+                             [(file_id, lib) for lib in libs])
+        self._db.executemany('INSERT INTO libs VALUES (?, ?, 1)',
+                             [(file_id, lib) for lib in private_libs])
+
+
+##############################################################################
+# Private functions
+
+def _file_identity(pcfile):
+    # Get the (st_dev, st_ino, st_size, st_mtime_ns) that identify the
+    # current contents of a file, or None if they cannot be known. Files in
+    # an archive use those of the archive. A file modified within
+    # RACY_INTERVAL could change again without its identity changing, so it
+    # is parsed again on the next update.
+    member = find_member(pcfile)
+    if member is not None:
+        if not isinstance(member[0], PcArchive):
+            # Files in memory can change at any time
+            return None
+        pcfile = member[0].path
+    try:
+        st = stat(pcfile)
+    except OSError:
+        return None
+    if time.time_ns() - st.st_mtime_ns <= RACY_INTERVAL:
+        return None
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _globals_fingerprint(global_variables):
+    # A digest of the global variables that packages are evaluated with
+    text = json.dumps(global_variables, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _operator_text(operator):
+    if operator == ALWAYS_MATCH:
+        return ''
+    return operator_to_text(operator)
+
+
+def _version_matches(version, operator, other):
+    # SQL function comparing two version strings using pkg-config's rules.
+    if version is None:
+        return False
+    version = Version(version)
+    other = Version(other)
+    operator = text_to_operator(operator)
+    if operator == LESS_THAN:
+        return version < other
+    elif operator == LESS_THAN_EQUAL:
+        return version <= other
+    elif operator == EQUAL:
+        return version == other
+    elif operator == NOT_EQUAL:
+        return version != other
+    elif operator == GREATER_THAN_EQUAL:
+        return version >= other
+    elif operator == GREATER_THAN:
+        return version > other
+    return True
+
+
+# vim: tw=79
+
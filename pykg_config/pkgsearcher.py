@@ -36,8 +36,10 @@
 __version__ = "$Revision: $"
 # $Source$
 
-from os import getenv, listdir
-from os.path import isdir, isfile, join, split, splitext
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv, scandir, stat
+from os.path import join, split, splitext
+from stat import S_ISDIR, S_ISREG
 import sys
 if sys.platform == 'win32':
     if sys.version_info[0] < 3:
@@ -46,11 +48,20 @@ if sys.platform == 'win32':
         import winreg as _winreg
 
 
+from pykg_config.dirindex import DirIndex
 from pykg_config.exceptions import PykgConfigError
+from pykg_config.manifest import Manifest
+from pykg_config.operators import ALWAYS_MATCH
 from pykg_config.options import Options
 from pykg_config.errorprinter import ErrorPrinter
 from pykg_config.package import Package
-from pykg_config.substitute import UndefinedVarError
+from pykg_config.packagespeclist import parse_package_spec_list
+from pykg_config.pcarchive import PcRegistry, open_archive
+from pykg_config.pcfile import read_pc_file, read_pc_file_version
+from pykg_config.pkgtable import PackageTable
+from pykg_config.substitute import InfiniteRecursionError, \
+        UndefinedVarError, substitute, Variables
+from pykg_config.version import Version
 
 try:
     from pykg_config.install_config import pc_path
@@ -116,18 +127,110 @@ class TargetTriple:
 
 thisArchTriple = TargetTriple()
 
+##############################################################################
+# StatCache object
+
+class StatCache:
+    """Remembers the result of stat() for each path it is asked about, so
+    that no path is stat-ed more than once. Paths that do not exist are
+    stored as None.
+
+    """
+    def __init__(self):
+        self._stats = {}
+
+    def stat(self, path):
+        try:
+            return self._stats[path]
+        except KeyError:
+            pass
+        try:
+            result = stat(path)
+        except OSError:
+            result = None
+        self._stats[path] = result
+        return result
+
+    def isdir(self, path):
+        st = self.stat(path)
+        return st is not None and S_ISDIR(st.st_mode)
+
+    def isfile(self, path):
+        st = self.stat(path)
+        return st is not None and S_ISREG(st.st_mode)
+
+    def forget(self, path):
+        self._stats.pop(path, None)
+
+    def clear(self):
+        self._stats.clear()
+
 ##############################################################################
 # PkgSearcher object
 
 class PkgSearcher:
-    def __init__(self, globals):
+    def __init__(self, globals, stat_cache=None, triple=None,
+                 package_cache=None):
+        # The stat cache and package cache (see pkgcache.py) may be shared
+        # with other searchers, e.g. when resolving packages for several
+        # sysroots. The target triple selects the architecture-specific
+        # default search directory.
         # This is a dictionary of packages found in the search path. Each
         # package name is linked to a list of full paths to .pc files, in
         # order of priority. Earlier in the list is preferred over later.
-        self._known_pkgs = {}
+        # It is only filled in when all packages are needed (see
+        # _scan_all()); single packages are found by probing the search
+        # directories directly.
+        self._known_pkgs = PackageTable()
+        self._all_scanned = False
+        # Directories to search, in order of priority, as given.
+        self._search_dirs = []
+        # The existing, distinct directories from _search_dirs, resolved as
+        # they are needed. The next directory to resolve is
+        # _search_dirs[_next_search_dir].
+        self._resolved_dirs = []
+        self._next_search_dir = 0
+        # (st_dev, st_ino) of each directory in _resolved_dirs, used to
+        # detect the same directory being reached by different paths.
+        self._dir_ids = set()
+        # The archive and directory within it of each search directory that
+        # is in a zip archive.
+        self._archive_dirs = {}
+        # Manifests read from the search directories (None if a directory
+        # has no manifest), by directory.
+        self._manifests = {}
+        # Names of packages found to be in none of the search directories.
+        self._missing = set()
+        # Virtual package names from the Provides fields of all known
+        # packages, each linked to a list of (pkgname, pcfile, dependency)
+        # tuples for the packages providing it. Only built if a package
+        # cannot be found by its own name.
+        self._provides = None
+        # Names found to be provided by no package.
+        self._unprovided = set()
+        if stat_cache is None:
+            stat_cache = StatCache()
+        self._stat_cache = stat_cache
+        if triple is None:
+            triple = thisArchTriple
+        self.triple = triple
+        self._package_cache = package_cache
         self.globals = globals
-
+        # The persistent directory index, if a cache directory is configured.
+        if Options().get_option('cache_dir'):
+            self._dir_index = DirIndex.in_cache_dir(
+                    Options().get_option('cache_dir'))
+        else:
+            self._dir_index = None
+
+        # Packages registered in memory, searched before and after the
+        # search directories.
+        self._registries = (
+                PcRegistry('<pykg-config registry {0:x}.first>'.format(id(self))),
+                PcRegistry('<pykg-config registry {0:x}.last>'.format(id(self))))
+        self._add_registry(self._registries[0])
         self._init_search_dirs()
+        self._add_registry(self._registries[1])
 
     def search_for_package(self, dep, globals):
         """Search for a package matching the given dependency specification
@@ -137,105 +240,246 @@ class PkgSearcher:
         Returns a parsed package object.
 
         """
-        # Get a list of pc files matching the package name
-        if isfile(dep.name) and splitext(dep.name)[1] == '.pc':
+        # Get the pc files matching the package name
+        if splitext(dep.name)[1] == '.pc' and \
+                self._stat_cache.isfile(dep.name):
             # No need to search for a pc file
             ErrorPrinter().debug_print('Using provided pc file %s', (dep.name))
-            pcfiles = [dep.name]
+            pcfiles = iter([dep.name])
         else:
             ErrorPrinter().debug_print('Searching for package matching %s', (dep))
-            pcfiles = self.search_for_pcfile(dep.name)
-        ErrorPrinter().debug_print('Found .pc files: %s', (str(pcfiles)))
-        if not pcfiles:
-            raise PackageNotFoundError(str(dep))
-        # Filter the list by those files that meet the version specification
-        pkgs = []
+            pcfiles = self._iter_candidates(dep.name)
+        # Try each file in order of priority, stopping at the first one that
+        # meets the version specification. Later files are not looked for
+        # unless they are needed.
+        found_pcfile = False
+        opened_pcfile = False
         for pcfile in pcfiles:
+            ErrorPrinter().debug_print('Found .pc file: %s', (pcfile))
+            found_pcfile = True
             try:
-                pkgs.append(Package(pcfile, globals))
+                pkg = self._load_package(pcfile, globals)
             except IOError as e:
                 ErrorPrinter().verbose_error("Failed to open '{0}': \
 {1}".format(pcfile, e.strerror))
                 continue
             except UndefinedVarError as e:
                 raise UndefinedVarError(e.variable, pcfile)
-        if not pkgs and pcfiles:
+            except InfiniteRecursionError as e:
+                raise InfiniteRecursionError(e.variable, pcfile)
+            opened_pcfile = True
+            if dep.meets_requirement(pkg.properties['version']):
+                return pkg
+            ErrorPrinter().debug_print('%s does not meet %s',
+                                       (pkg.properties['version'], dep))
+        if not found_pcfile:
+            pkg = self._search_providers(dep, globals)
+            if pkg is not None:
+                return pkg
+        if found_pcfile and not opened_pcfile:
             # Raise an error indicating that all pc files we could try were
             # unopenable. This is necessary to match pkg-config's odd lack of
             # the standard "Package not found" error when a bad file is
             # encountred.
             raise NoOpenableFilesError(str(dep))
-        pkgs = [pkg for pkg in pkgs \
-                if dep.meets_requirement(pkg.properties['version'])]
-        ErrorPrinter().debug_print('Filtered to %s',
-                                   ([pkg.properties['name'] for pkg in pkgs]))
-        if not pkgs:
-            raise PackageNotFoundError(str(dep))
-        return pkgs[0]
+        raise PackageNotFoundError(str(dep))
+
+    def package_exists(self, dep, globals):
+        """Check if a package matching the given dependency specification
+        can be found, without parsing any pc files. A specification with no
+        version restriction is decided by the package name alone; otherwise
+        only the Version field of each candidate is read.
+
+        """
+        for pcfile in self._iter_candidates(dep.name):
+            if dep.operator == ALWAYS_MATCH:
+                return True
+            try:
+                version = read_pc_file_version(pcfile, globals)
+                if version:
+                    version = Version(version)
+                else:
+                    version = Version()
+            except (IOError, PykgConfigError) as e:
+                ErrorPrinter().debug_print('Failed to read version of %s: %s',
+                                           (pcfile, e))
+                continue
+            if dep.meets_requirement(version):
+                return True
+        return False
 
     def search_for_pcfile(self, pkgname):
         """Search for one or more pkg-config files matching the given
         package name. If a matching pkg-config file cannot be found,
         an empty list will be returned.
 
-        The dictionary of known packages is stored in _known_pkgs and is
-        initialised by calling init_search_dirs().
+        """
+        return list(self._iter_candidates(pkgname))
+
+    def package_names_matching(self, pattern):
+        """Get the names of the packages found on the system that match a
+        shell-style pattern (e.g. 'qt*'), in sorted order. No pc files are
+        parsed.
 
         """
-        ErrorPrinter().debug_print('Looking for files matching %s', (pkgname))
-        if Options().get_option('prefer_uninstalled'):
-            if pkgname + '-uninstalled' in self._known_pkgs:
-                # Prefer uninstalled version of a package
-                ErrorPrinter().debug_print('Using uninstalled package %s',
-                                           (self._known_pkgs[pkgname + '-uninstalled']))
-                return self._known_pkgs[pkgname + '-uninstalled']
-            elif Options().get_option('uninstalled_only'):
-                ErrorPrinter().debug_print('Uninstalled only, no suitable package.')
-                return []
-        if pkgname in self._known_pkgs:
-            ErrorPrinter().debug_print('Using any package: %s',
-                             (self._known_pkgs[pkgname]))
-            return self._known_pkgs[pkgname]
-        else:
-            ErrorPrinter().debug_print('No suitable package found')
-            return []
+        self._scan_all()
+        return self._known_pkgs.matching(pattern)
 
-    def known_packages_list(self):
+    def known_packages_list(self, patterns=None):
         """Return a list of all packages found on the system, giving a name and
         a description (from the .pc file) for each, and also a list of any
-        errors encountered.
+        errors encountered. If a list of shell-style patterns is given, only
+        the packages with a name matching one of them are included (and
+        parsed).
 
         """
         result = []
         errors = []
-        for pkgname in self._known_pkgs:
+        self._scan_all()
+        if patterns is None:
+            pkgnames = self._known_pkgs
+        else:
+            pkgnames = sorted(set(name for pattern in patterns \
+                                  for name in self._known_pkgs.matching(pattern)))
+        for pkgname in pkgnames:
             # Use the highest-priority version of the package
+            pcfile = self._known_pkgs.first(pkgname)
+            header = self._manifest_header(pcfile)
+            if header is not None:
+                result.append((pkgname, header['name'], header['description']))
+                continue
             try:
-                pkg = Package(self._known_pkgs[pkgname][0])
+                pkg = Package(pcfile, header_only=True)
             except IOError as e:
                 ErrorPrinter().verbose_error("Failed to open '{0}': \
-{1}".format(self._known_pkgs[pkgname][0], e.strerror))
+{1}".format(pcfile, e.strerror))
                 continue
             except UndefinedVarError as e:
                 errors.append("Variable '{0}' not defined in '{1}'".format(e,
-                    self._known_pkgs[pkgname][0]))
+                    pcfile))
+                continue
+            except InfiniteRecursionError as e:
+                errors.append("Variable '{0}' refers to itself in '{1}'".format(
+                    e, pcfile))
                 continue
             result.append((pkgname, pkg.properties['name'], pkg.properties['description']))
         return result, errors
 
+    def known_pcfiles(self, rescan=False):
+        """Get every package found on the system, as a list of (name,
+        pcfiles) pairs with the pcfiles in order of priority. If rescan is
+        True, the search directories are scanned again rather than using the
+        results of an earlier scan.
+
+        """
+        if rescan:
+            self._rescan_all()
+        else:
+            self._scan_all()
+        return [(pkgname, self._known_pkgs[pkgname]) \
+                for pkgname in self._known_pkgs]
+
+    def search_dirs(self):
+        """Get the directories in the file system that are searched, in
+        order of priority. Directories that do not exist, repeats of a
+        directory, zip archives and in-memory registries are not included.
+
+        """
+        return [d for d in self._iter_search_dirs() \
+                if d not in self._archive_dirs]
+
+    def refresh_package(self, pkgname):
+        """Update the pc files known for a package name after files for it
+        have been added to, removed from or modified in the search
+        directories.
+
+        """
+        filename = pkgname + '.pc'
+        self._missing.discard(pkgname)
+        # The package may provide other names
+        self._unprovided.clear()
+        for d in self._resolved_dirs:
+            self._stat_cache.forget(join(d, filename))
+            if self._package_cache is not None:
+                self._package_cache.forget(join(d, filename))
+            # The directory's mtime is needed to check the index of missing
+            # packages
+            self._stat_cache.forget(d)
+        if not self._all_scanned:
+            # Lookups probe the directories, which will now see the change
+            return
+        self._known_pkgs[pkgname] = [join(d, filename) \
+                for d in self._iter_search_dirs() \
+                if self._dir_contains(d, filename)]
+        if self._provides is not None:
+            for name, providers in list(self._provides.items()):
+                providers[:] = [p for p in providers if p[0] != pkgname]
+                if not providers:
+                    del self._provides[name]
+            for pcfile in self._known_pkgs.get(pkgname, []):
+                self._index_provides(pkgname, pcfile)
+
+    def register_package(self, pkgname, text=None, variables=None,
+                         properties=None, first=True):
+        """Make a package available without a pkg-config file on disk.
+
+        The package is given either as the text of a pkg-config file, or
+        as dictionaries of variables and properties with their raw
+        (unsubstituted) values, e.g. {'prefix': '/usr'} and
+        {'Name': 'foo', 'Libs': '-L${prefix}/lib -lfoo'}. Variables are
+        defined in the order of the dictionary.
+
+        Registered packages are searched before all search directories if
+        first is True, and after them otherwise. Registering a package name
+        again replaces it.
+
+        """
+        self.unregister_package(pkgname)
+        if first:
+            registry = self._registries[0]
+        else:
+            registry = self._registries[1]
+        registry.add(pkgname + '.pc', text, variables, properties)
+        self.refresh_package(pkgname)
+
+    def unregister_package(self, pkgname):
+        """Remove a package added with register_package()."""
+        filename = pkgname + '.pc'
+        for registry in self._registries:
+            if registry.has_member(filename):
+                registry.remove(filename)
+                self.refresh_package(pkgname)
+
+    def _rescan_all(self):
+        # Forget everything known about the contents of the search directories
+        # and scan them again. Returns the names of all packages known before
+        # and after.
+        names = set(self._known_pkgs)
+        self._missing.clear()
+        self._provides = None
+        self._unprovided.clear()
+        self._stat_cache.clear()
+        if self._package_cache is not None:
+            self._package_cache.forget()
+        self._known_pkgs = PackageTable()
+        self._all_scanned = False
+        self._scan_all()
+        names.update(self._known_pkgs)
+        return names
+
     def _init_search_dirs(self):
+        # Build the list of directories to search, in priority order. The
+        # directories are not listed until their contents are needed.
         # Append dirs in PKG_CONFIG_PATH
         if "config_path" in self.globals and self.globals["config_path"]:
             for d in self.globals["config_path"]:
-                if not d or not isdir(d):
-                    continue
-                self._append_packages(d)
+                if d:
+                    self._add_search_dir(d)
         # Append dirs in PKG_CONFIG_LIBDIR
         if "config_libdir" in self.globals and self.globals["config_libdir"]:
             for d in self.globals["config_libdir"]:
-                if not d or not isdir(d):
-                    continue
-                self._append_packages(d)
+                if d:
+                    self._add_search_dir(d)
         if sys.platform == 'win32':
             key_path = 'Software\\pkg-config\\PKG_CONFIG_PATH'
             for root in ((_winreg.HKEY_CURRENT_USER, 'HKEY_CURRENT_USER'),
@@ -250,8 +494,8 @@ class PkgSearcher:
                     num_subkeys, num_vals, modified = _winreg.QueryInfoKey(key)
                     for ii in range(num_vals):
                         name, val, type = _winreg.EnumValue(key, ii)
-                        if type == _winreg.REG_SZ and isdir(val):
-                            self._append_packages(val)
+                        if type == _winreg.REG_SZ and val:
+                            self._add_search_dir(val)
                 except WindowsError as e:
                     ErrorPrinter().debug_print('Failed to add paths from \
 {0}\\{1}: {2}'.format(root[1], key_path, e))
@@ -265,8 +509,8 @@ class PkgSearcher:
             prefix = sys.prefix
         if pc_path:
             for d in pc_path.split(self._split_char()):
-                if d and isdir(d):
-                    self._append_packages(d)
+                if d:
+                    self._add_search_dir(d)
         # Default path: Else append prefix/lib/pkgconfig, prefix/share/pkgconfig
         else:
             if Options().get_option('is_64bit'):
@@ -275,32 +519,388 @@ class PkgSearcher:
                 suffix = ''
             dirs2check = (
                 join(prefix, 'lib' + suffix),
-                join(prefix, 'lib', str(thisArchTriple)),
+                join(prefix, 'lib', str(self.triple)),
                 join(prefix, 'share'),
                 join(prefix, "lib")
             )
             for d in dirs2check:
-                d = join(d, "pkgconfig")
-                if isdir(d):
-                    self._append_packages(d)
+                self._add_search_dir(join(d, "pkgconfig"))
+
+    def _add_search_dir(self, d):
+        # Directories that do not exist are left in the list; they are
+        # simply found to be empty when probed or listed.
+        if d not in self._search_dirs:
+            self._search_dirs.append(d)
+
+    def _add_registry(self, registry):
+        # Add a registry of in-memory files to the search directories
+        self._add_search_dir(registry.path)
+        self._archive_dirs[registry.path] = (registry, '')
+
+    def _scan_all(self):
+        # Add the packages from every search directory to the known packages,
+        # in priority order. Only needed when all packages must be known,
+        # e.g. for --list-all.
+        if self._all_scanned:
+            return
+        workers = Options().get_option('scan_workers')
+        if workers > 1:
+            listings = self._list_all_parallel(workers)
+        else:
+            listings = ((d, self._list_pc_files(d)) \
+                        for d in self._iter_search_dirs())
+        for d, files in listings:
+            self._append_packages(d, files)
+        self._all_scanned = True
+        if self._dir_index is not None:
+            self._dir_index.save()
+
+    def _load_package(self, pcfile, globals):
+        # Parse a pc file, sharing the work with other searchers if possible.
+        # Only the header is read if the command does not need the flags.
+        header_only = Options().get_option('header_only')
+        if self._package_cache is None:
+            return Package(pcfile, globals, header_only=header_only)
+        return self._package_cache.load(pcfile, globals, header_only)
+
+    def _search_providers(self, dep, globals):
+        # Search for a package that provides the dependency's name as a
+        # virtual package. A provided name without a version takes the
+        # version of the providing package.
+        if splitext(dep.name)[1] == '.pc':
+            return None
+        if self._known_unprovided(dep.name):
+            ErrorPrinter().debug_print('%s is known not to be provided',
+                                       (dep.name))
+            return None
+        providers = self._provides_index().get(dep.name, [])
+        if not providers:
+            self._add_unprovided(dep.name)
+        for pkgname, pcfile, provided in providers:
+            try:
+                pkg = self._load_package(pcfile, globals)
+            except IOError as e:
+                ErrorPrinter().verbose_error("Failed to open '{0}': \
+{1}".format(pcfile, e.strerror))
+                continue
+            except UndefinedVarError as e:
+                raise UndefinedVarError(e.variable, pcfile)
+            except InfiniteRecursionError as e:
+                raise InfiniteRecursionError(e.variable, pcfile)
+            if provided.version.is_empty():
+                version = pkg.properties['version']
+            else:
+                version = provided.version
+            if dep.meets_requirement(version):
+                ErrorPrinter().debug_print('Using %s, which provides %s',
+                                           (pcfile, provided))
+                return pkg
+        return None
+
+    def _provides_index(self):
+        # Get the index of virtual packages provided by the known packages,
+        # building it the first time it is needed.
+        if self._provides is None:
+            self._provides = {}
+            for pkgname, pcfiles in self.known_pcfiles():
+                for pcfile in pcfiles:
+                    self._index_provides(pkgname, pcfile)
+            if self._dir_index is not None:
+                self._dir_index.save()
+        return self._provides
+
+    def _index_provides(self, pkgname, pcfile):
+        # Add the virtual packages provided by a pc file to the index, using
+        # the file's manifest entry instead of reading it if possible.
+        header = self._manifest_header(pcfile)
+        try:
+            if header is not None and header.get('provides') is not None:
+                provides = parse_package_spec_list(header['provides'])
+            else:
+                raw_vars, value = self._read_provides(pcfile)
+                provides = parse_package_spec_list(substitute(value,
+                        Variables(raw_vars, self.globals), self.globals))
+        except (IOError, PykgConfigError) as e:
+            ErrorPrinter().debug_print('Failed to read provides of %s: %s',
+                                       (pcfile, e))
+            return
+        for provided in provides:
+            self._provides.setdefault(provided.name, []).append(
+                    (pkgname, pcfile, provided))
+
+    def _read_provides(self, pcfile):
+        # Get the raw value of a pc file's Provides field and the raw
+        # variables it may use, from the directory index if the file is
+        # unchanged. Otherwise only the file's header is read.
+        st = self._stat_cache.stat(pcfile)
+        if self._dir_index is not None and st is not None:
+            entry = self._dir_index.get_provides(pcfile, st)
+            if entry is not None:
+                return entry
+        raw_vars, vars, props = read_pc_file(pcfile, self.globals,
+                                             ['provides'])
+        value = props['provides']
+        if '${' not in value:
+            raw_vars = {}
+        if self._dir_index is not None and st is not None:
+            self._dir_index.set_provides(pcfile, st, raw_vars, value)
+        return raw_vars, value
+
+    def _iter_candidates(self, pkgname):
+        # Yield the pc files that may be used for the given package name, in
+        # order of priority, taking the preference for uninstalled packages
+        # into account.
+        ErrorPrinter().debug_print('Looking for files matching %s', (pkgname))
+        if Options().get_option('prefer_uninstalled'):
+            uninstalled = self._iter_pcfiles(pkgname + '-uninstalled')
+            first = next(uninstalled, None)
+            if first is not None:
+                # Prefer uninstalled version of a package
+                ErrorPrinter().debug_print('Using uninstalled package %s',
+                                           (first))
+                yield first
+                for pcfile in uninstalled:
+                    yield pcfile
+                return
+            elif Options().get_option('uninstalled_only'):
+                ErrorPrinter().debug_print('Uninstalled only, no suitable package.')
+                return
+        for pcfile in self._iter_pcfiles(pkgname):
+            yield pcfile
+
+    def _iter_pcfiles(self, pkgname):
+        # Yield the pc files for the given package name in priority order.
+        # Directories are probed one at a time as the caller asks for more
+        # candidates, so finding a package in the first search directory
+        # costs a single stat() call.
+        if self._all_scanned:
+            for pcfile in self._known_pkgs.get(pkgname, []):
+                yield pcfile
+            return
+        filename = pkgname + '.pc'
+        registries = [registry.path for registry in self._registries]
+        if self._known_missing(pkgname):
+            ErrorPrinter().debug_print('%s is known to be missing', (filename))
+            dirs = registries
+        else:
+            dirs = self._iter_search_dirs()
+        found = False
+        for d in dirs:
+            if self._dir_contains(d, filename):
+                found = found or d not in registries
+                yield join(d, filename)
+        if not found:
+            self._add_missing(pkgname)
+
+    def _known_missing(self, pkgname):
+        # Check if a package is known to be in none of the search directories
+        # (not counting registries), without probing them.
+        if pkgname in self._missing:
+            return True
+        if self._dir_index is None:
+            return False
+        state = self._search_dirs_state()
+        if state is None or pkgname not in self._dir_index.get_missing(*state):
+            return False
+        self._missing.add(pkgname)
+        return True
+
+    def _add_missing(self, pkgname):
+        # Record that a package is in none of the search directories, so that
+        # probing for it again can be skipped.
+        if pkgname in self._missing:
+            return
+        self._missing.add(pkgname)
+        if self._dir_index is None:
+            return
+        state = self._search_dirs_state()
+        if state is not None:
+            self._dir_index.add_missing(state[0], state[1], pkgname)
+            self._dir_index.save()
+
+    def _known_unprovided(self, name):
+        # Check if a name is provided by no package, without building the
+        # index of provided names. The directory index only covers the
+        # search directories, so it is not used while packages are
+        # registered.
+        if name in self._unprovided:
+            return True
+        if self._dir_index is None or \
+                any(registry.pc_files('') for registry in self._registries):
+            return False
+        state = self._search_dirs_state()
+        if state is None or name not in self._dir_index.get_unprovided(*state):
+            return False
+        self._unprovided.add(name)
+        return True
 
-    def _append_packages(self, d):
+    def _add_unprovided(self, name):
+        # Record that a name is provided by no package, so that the index of
+        # provided names need not be built again to find that out.
+        self._unprovided.add(name)
+        if self._dir_index is None:
+            return
+        state = self._search_dirs_state()
+        if state is not None:
+            self._dir_index.add_unprovided(state[0], state[1], name)
+            self._dir_index.save()
+
+    def _search_dirs_state(self):
+        # Get the search directories, excluding registries, and their
+        # modification times (those of the archive for directories in zip
+        # archives). Adding or removing a .pc file changes the modification
+        # time of its directory. Returns None if a directory can no longer be
+        # found.
+        dirs = []
+        mtimes = []
+        for d in self._iter_search_dirs():
+            if d in self._archive_dirs:
+                archive = self._archive_dirs[d][0]
+                if archive in self._registries:
+                    continue
+                st = self._stat_cache.stat(archive.path)
+            else:
+                st = self._stat_cache.stat(d)
+            if st is None:
+                return None
+            dirs.append(d)
+            mtimes.append(st.st_mtime_ns)
+        return dirs, mtimes
+
+    def _dir_contains(self, d, filename):
+        # Check if a search directory contains a file.
+        if d in self._archive_dirs:
+            archive, inner = self._archive_dirs[d]
+            return archive.contains(inner, filename)
+        return self._stat_cache.isfile(join(d, filename))
+
+    def _iter_search_dirs(self):
+        # Yield the search directories that exist, in priority order. A
+        # directory reached by more than one path (e.g. through a symlink, or
+        # by being listed in both PKG_CONFIG_PATH and the default path) is
+        # only yielded the first time. Directories in zip archives are
+        # included.
+        ii = 0
+        while True:
+            if ii < len(self._resolved_dirs):
+                yield self._resolved_dirs[ii]
+                ii += 1
+            elif self._next_search_dir < len(self._search_dirs):
+                d = self._search_dirs[self._next_search_dir]
+                self._next_search_dir += 1
+                if d in self._archive_dirs:
+                    # A registry
+                    dir_id = d
+                else:
+                    st = self._stat_cache.stat(d)
+                    if st is not None and S_ISDIR(st.st_mode):
+                        dir_id = (st.st_dev, st.st_ino)
+                    else:
+                        dir_id = self._resolve_archive_dir(d)
+                        if dir_id is None:
+                            continue
+                if dir_id in self._dir_ids:
+                    ErrorPrinter().debug_print('Skipping %s; already searched',
+                                               (d))
+                    continue
+                self._dir_ids.add(dir_id)
+                self._resolved_dirs.append(d)
+            else:
+                return
+
+    def _resolve_archive_dir(self, d):
+        # Check if a search path entry is a zip archive or a directory in one.
+        # If it is, record the archive and directory within it, and return
+        # an ID for the directory; otherwise return None.
+        path = d
+        inner = []
+        while True:
+            st = self._stat_cache.stat(path)
+            if st is not None:
+                break
+            parent, base = split(path)
+            if parent == path:
+                return None
+            if base:
+                inner.insert(0, base)
+            path = parent
+        if not S_ISREG(st.st_mode):
+            return None
+        archive = open_archive(path)
+        inner = '/'.join(inner)
+        if archive is None or not archive.has_dir(inner):
+            return None
+        ErrorPrinter().debug_print('Searching %s in archive %s', (inner, path))
+        self._archive_dirs[d] = (archive, inner)
+        return (st.st_dev, st.st_ino, inner)
+
+    def _list_all_parallel(self, workers):
+        # List all search directories using a pool of threads, for file
+        # systems where each call has a high latency. Returns a list of
+        # (directory, files) pairs in the same order as _iter_search_dirs().
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Fill the stat cache concurrently, then resolve the directories
+            # in order so that duplicates are dropped exactly as when
+            # scanning serially.
+            pending = self._search_dirs[self._next_search_dir:]
+            list(executor.map(self._stat_cache.stat, pending))
+            dirs = list(self._iter_search_dirs())
+            return list(zip(dirs, executor.map(self._list_pc_files, dirs)))
+
+    def _append_packages(self, d, files):
         ErrorPrinter().debug_print('Adding .pc files from %s to known packages',
                                    (d))
-        files = listdir(d)
         for filename in files:
-            if filename.endswith('.pc'):
-                # Test if the file can be opened (pkg-config glosses over,
-                # e.g. links that are now dead, as if they were never there).
-                full_path = join(d, filename)
-                name = filename[:-3]
-                if name in self._known_pkgs:
-                    if full_path not in self._known_pkgs[name]:
-                        self._known_pkgs[name].append(full_path)
-                        ErrorPrinter().debug_print('Package %s has a duplicate file: %s',
-                                                   (name, self._known_pkgs[name]))
-                else:
-                    self._known_pkgs[name] = [full_path]
+            # Test if the file can be opened (pkg-config glosses over,
+            # e.g. links that are now dead, as if they were never there).
+            name = filename[:-3]
+            is_duplicate = name in self._known_pkgs
+            if self._known_pkgs.append(name, d, filename) and is_duplicate:
+                ErrorPrinter().debug_print('Package %s has a duplicate file: %s',
+                                           (name, self._known_pkgs[name]))
+
+    def _list_pc_files(self, d):
+        # Get the names of the .pc files in a directory, using the directory
+        # index or the directory's manifest if either is up to date.
+        if d in self._archive_dirs:
+            archive, inner = self._archive_dirs[d]
+            return archive.pc_files(inner)
+        mtime = self._stat_cache.stat(d).st_mtime_ns
+        if self._dir_index is not None:
+            files = self._dir_index.get(d, mtime)
+            if files is not None:
+                return files
+        manifest = self._manifest(d)
+        if manifest is not None and manifest.mtime == mtime:
+            ErrorPrinter().debug_print('Using manifest of %s', (d))
+            files = manifest.pc_files()
+        else:
+            try:
+                with scandir(d) as entries:
+                    # Directory entries usually carry the file type, so this
+                    # does not need to stat each file.
+                    files = [e.name for e in entries
+                             if e.name.endswith('.pc') and not e.is_dir()]
+            except OSError as e:
+                ErrorPrinter().debug_print('Failed to list %s: %s', (d, e))
+                return []
+        if self._dir_index is not None:
+            self._dir_index.set(d, mtime, files)
+        return files
+
+    def _manifest(self, d):
+        # Get the manifest of a directory, reading it only once.
+        if d not in self._manifests:
+            self._manifests[d] = Manifest.read(d)
+        return self._manifests[d]
+
+    def _manifest_header(self, pcfile):
+        # Get the manifest entry for a pc file if it is still valid.
+        d, filename = split(pcfile)
+        manifest = self._manifest(d)
+        if manifest is None:
+            return None
+        return manifest.header(filename, self._stat_cache.stat(pcfile))
 
     def _split_char(self):
         # Get the character used to split a list of directories.
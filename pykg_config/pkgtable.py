@@ -0,0 +1,212 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: pkgtable.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Compact storage for the table of known packages.
+
+Maps each package name to the list of pkg-config files for it, in order
+of priority. Rather than storing a list of full paths for each package,
+each directory is stored once and each file is stored as a row holding
+the directory's index and the file name, in array-backed columns. The
+files of a package are chained together through the rows. The file name
+is only stored if it is not the usual <package name>.pc.
+
+The names are also kept in a sorted list, built when first needed, so that
+the names matching a pattern with a literal prefix (e.g. 'gst*-1.0') can be
+found by binary search instead of testing every name.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from fnmatch import translate
+from os.path import join, split
+import re
+import sys
+
+# Marks the end of a chain of rows
+END = -1
+# Characters that start a wildcard in a shell-style pattern
+WILDCARDS = re.compile(r'[*?[]')
+
+##############################################################################
+# PackageTable object
+
+class PackageTable(MutableMapping):
+    """A dictionary-like table of package names to lists of full paths to
+    .pc files.
+
+    Storing an empty list removes the package.
+
+    """
+    def __init__(self):
+        # Directories, by index
+        self._dirs = []
+        self._dir_ids = {}
+        # Columns of the rows: directory index, file name (None for
+        # <package name>.pc), next row of the same package.
+        self._row_dir = array('I')
+        self._row_file = []
+        self._row_next = array('i')
+        # The first row of each package
+        self._heads = {}
+        # Rows no longer reachable from any package
+        self._unused_rows = 0
+        # All names in sorted order, or None if it must be rebuilt
+        self._sorted_names = None
+
+    def __getitem__(self, name):
+        result = []
+        row = self._heads[name]
+        while row != END:
+            result.append(self._path(name, row))
+            row = self._row_next[row]
+        return result
+
+    def __setitem__(self, name, paths):
+        if name in self._heads:
+            del self[name]
+        for path in paths:
+            d, filename = split(path)
+            self.append(name, d, filename)
+
+    def __delitem__(self, name):
+        row = self._heads.pop(name)
+        self._sorted_names = None
+        while row != END:
+            self._unused_rows += 1
+            row = self._row_next[row]
+        if self._unused_rows > 1024 and \
+                self._unused_rows > len(self._row_next) // 2:
+            self._compact()
+
+    def __iter__(self):
+        return iter(self._heads)
+
+    def __len__(self):
+        return len(self._heads)
+
+    def __contains__(self, name):
+        return name in self._heads
+
+    def __repr__(self):
+        return 'PackageTable({0!r})'.format(dict(self.items()))
+
+    def first(self, name):
+        """Get the highest-priority file for a package name."""
+        return self._path(name, self._heads[name])
+
+    def matching(self, pattern):
+        """Get the package names matching a shell-style pattern (e.g.
+        'qt*' or 'gst*-1.0'), in sorted order.
+
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._heads)
+        names = self._sorted_names
+        prefix = WILDCARDS.split(pattern, 1)[0]
+        match = re.compile(translate(pattern)).match
+        result = []
+        for ii in range(bisect_left(names, prefix), len(names)):
+            name = names[ii]
+            if not name.startswith(prefix):
+                break
+            if match(name):
+                result.append(name)
+        return result
+
+    def append(self, name, d, filename):
+        """Add a file in directory d to the end of the list of files for a
+        package name, unless it is already in the list.
+
+        Returns True if the file was added.
+
+        """
+        dir_id = self._dir_ids.get(d)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(d)
+            self._dir_ids[d] = dir_id
+        if filename == name + '.pc':
+            filename = None
+        row = self._heads.get(name, END)
+        last = END
+        while row != END:
+            if self._row_dir[row] == dir_id and self._row_file[row] == filename:
+                return False
+            last = row
+            row = self._row_next[row]
+        new_row = len(self._row_next)
+        self._row_dir.append(dir_id)
+        self._row_file.append(filename)
+        self._row_next.append(END)
+        if last == END:
+            self._heads[sys.intern(name)] = new_row
+            self._sorted_names = None
+        else:
+            self._row_next[last] = new_row
+        return True
+
+    def _path(self, name, row):
+        filename = self._row_file[row]
+        if filename is None:
+            filename = name + '.pc'
+        return join(self._dirs[self._row_dir[row]], filename)
+
+    def _compact(self):
+        # Rebuild the columns without the unused rows
+        old_dir, old_file, old_next = \
+                self._row_dir, self._row_file, self._row_next
+        self._row_dir = array('I')
+        self._row_file = []
+        self._row_next = array('i')
+        for name in self._heads:
+            row = self._heads[name]
+            last = END
+            while row != END:
+                new_row = len(self._row_next)
+                self._row_dir.append(old_dir[row])
+                self._row_file.append(old_file[row])
+                self._row_next.append(END)
+                if last == END:
+                    self._heads[name] = new_row
+                else:
+                    self._row_next[last] = new_row
+                last = new_row
+                row = old_next[row]
+        self._unused_rows = 0
+
+
+# vim: tw=79
+
@@ -48,6 +48,7 @@ empty_raw_props = {'name': '',
                    'requires': '',
                    'requires.private': '',
                    'conflicts': '',
+                   'provides': '',
                    'cflags': '',
                    'libs': '',
                    'libs.private': ''}
@@ -58,6 +59,7 @@ empty_processed_props = {'name': '',
                          'requires': [],
                          'requires.private': [],
                          'conflicts': [],
+                         'provides': [],
                          'include_dirs': [],
                          'other_cflags': [],
                          'libs': [],
@@ -66,6 +68,15 @@ empty_processed_props = {'name': '',
                          'private.libs': [],
                          'private.libpaths': [],
                          'private.otherlibs': []}
+# The properties read when only the header of a package is needed, e.g. for
+# --exists, --modversion and --list-all
+HEADER_PROPERTIES = ('name', 'description', 'url', 'version', 'requires',
+                     'requires.private', 'conflicts', 'provides')
+# The processed properties that come from the Cflags, Libs and Libs.private
+# properties
+FLAG_PROPERTIES = ('include_dirs', 'other_cflags', 'libs', 'libpaths',
+                   'otherlibs', 'private.libs', 'private.libpaths',
+                   'private.otherlibs')
 
 
 # vim: tw=79
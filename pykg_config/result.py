@@ -87,7 +87,7 @@ def _filter_duplicates(source):
 # PkgCfgResult object
 
 class PkgCfgResult:
-    def __init__(self, globals):
+    def __init__(self, globals, searcher=None):
         # Different platforms may use different flags and extensions
         if sys.platform == 'win32' and Options().get_option('use_msvc_syntax'):
             self.lib_path_flag = '/libpath:'
@@ -100,7 +100,9 @@ class PkgCfgResult:
         # collections.OrderedDict).
         self.packages = []
         self.searched_packages = []
-        self.searcher = PkgSearcher(globals)
+        if searcher is None:
+            searcher = PkgSearcher(globals)
+        self.searcher = searcher
         self.globals = globals
 
     def __str__(self):
@@ -193,17 +195,20 @@ class PkgCfgResult:
         dependencies."""
         for pkg in self.searched_packages:
             loaded_pkg = self._get_loaded_package(pkg.name)
-            if loaded_pkg.variables.has_key(variable):
-                return loaded_pkg.variables[variable]
+            if variable in loaded_pkg.variables:
+                return loaded_pkg.get_variable(variable)
         # Not in the searched-for packages, so try the dependencies
         for name, pkg in self.packages:
-            if pkg.variables.has_key(variable):
-                return pkg.variables[variable]
+            if variable in pkg.variables:
+                return pkg.get_variable(variable)
         return None
 
-    def known_packages_list(self):
-        """Get a list of all the packages found on the system."""
-        return self.searcher.known_packages_list()
+    def known_packages_list(self, patterns=None):
+        """Get a list of all the packages found on the system, or those with
+        a name matching one of a list of shell-style patterns.
+
+        """
+        return self.searcher.known_packages_list(patterns)
 
     def have_uninstalled(self):
         for name, pkg in self.packages:
@@ -246,16 +251,14 @@ class PkgCfgResult:
             pkg = self.searcher.search_for_package(dep, self.globals)
         # 2. Check for conflicts
             for conflict in pkg.properties['conflicts']:
-                try:
-                    ErrorPrinter().debug_print('Searching for conflict %s',
-                                               conflict.name)
-                    self.searcher.search_for_package(conflict)
-                except PackageNotFoundError:
+                ErrorPrinter().debug_print('Searching for conflict %s',
+                                           (conflict))
+                if not self.searcher.package_exists(conflict, self.globals):
                     # If the conflict was not found, move on to the next
                     ErrorPrinter().debug_print('Conflict not found.')
                     continue
                 # Conflict was found - what to do?
-                raise PackageConflictError(pkg.name, conflict)
+                raise PackageConflictError(pkg.properties['name'], conflict)
         # 3. Sanity check this package
             pkg.sanity_check()
         # 4. Add this package to the dictionary now to avoid infinite recursion
@@ -31,15 +31,19 @@
 
 """Substitutes values. 
 
-Recursive substitution can be performed until no substitutions are left.
-An infinite recursion check is performed first to prevent infinite
-loops in this case.
+The variables of a package are substituted on demand, following the
+variables each one uses; a variable that uses itself, directly or through
+others, is detected as infinite recursion.
+
+Values are compiled into templates of literal text and variable names,
+which are memoized, so each distinct value is only scanned once.
 
 """
 
 __version__ = "$Revision: $"
 # $Source$
 
+from collections.abc import MutableMapping
 import re
 
 from pykg_config.exceptions import PykgConfigError
@@ -53,10 +57,12 @@ class InfiniteRecursionError(PykgConfigError):
 
     Attributes:
         variable -- The variable that refers to itself.
+        pkgfile -- The file with the error. Not always set.
 
     """
-    def __init__(self, variable):
+    def __init__(self, variable, pkgfile=None):
         self.variable = variable
+        self.pkgfile = pkgfile
 
     def __str__(self):
         return self.variable
@@ -87,16 +93,209 @@ def substitute(value, replacements, globals={}):
     Variables in the given value are substituted. No recursion is
     performed. replacements is a dictionary of variables.
 
+    Each variable used in the value is substituted in the order they are
+    first used, so a substituted value may itself have the variables that
+    come later in that order substituted, but not those that come earlier
+    or the variable itself. The value and each substituted value are
+    compiled into templates (see compile_template()), so the time taken is
+    linear in the size of the value and the result.
+
+    """
+    return render(compile_template(value), replacements, globals)
+
+
+def compile_template(value):
+    """Compile a value into a Template. Templates are memoized by value, so
+    a value that is substituted repeatedly (e.g. a variable used by many
+    other variables) is only scanned once. Values that use no variables are
+    not memoized, so that the many plain values do not crowd out the rest.
+
     """
-    for name in get_all_substitutions(value):
+    if '${' not in value:
+        return Template(value)
+    template = _templates.get(value)
+    if template is None:
+        if len(_templates) >= MAX_TEMPLATES:
+            _templates.clear()
+        template = Template(value)
+        _templates[value] = template
+    return template
+
+
+def render(template, replacements, globals={}):
+    """Substitute the variables in a compiled value, as substitute() does.
+    The values of the variables are rendered from their templates.
+
+    """
+    names = template.names
+    if not names:
+        return template.collapsed()
+    order = {}
+    templates = []
+    for ii, name in enumerate(names):
         if name in globals:
-            value = replace_in_string(value, name, globals[name])
+            templates.append(compile_template(globals[name]))
         elif name in replacements:
-            value = replace_in_string(value, name, replacements[name])
+            templates.append(compile_template(replacements[name]))
         else:
             raise UndefinedVarError(name)
-    value = collapse_escapes(value)
-    return value
+        order[name] = ii
+    # Render the values of the later variables first, as earlier ones may
+    # use them.
+    rendered = [None] * len(names)
+    for ii in range(len(names) - 1, -1, -1):
+        rendered[ii] = templates[ii].fill(ii, order, rendered)
+    return collapse_escapes(template.fill(-1, order, rendered))
+
+
+##############################################################################
+# Template object
+
+# Maximum number of memoized templates
+MAX_TEMPLATES = 8192
+
+class Template:
+    """A value compiled into alternating literal text and names of the
+    variables used, e.g. 'a${b}c' becomes ['a', 'b', 'c'].
+
+    Attributes:
+        parts -- The literal text and the names, alternating.
+        names -- The names used, in the order they are first used.
+
+    """
+    __slots__ = ('value', 'parts', 'names')
+
+    def __init__(self, value):
+        self.value = value
+        if '${' in value:
+            self.parts = _reference_re.split(value)
+        else:
+            self.parts = [value]
+        self.names = list(dict.fromkeys(self.parts[1::2]))
+
+    def collapsed(self):
+        """Get the value with escaped '$' characters collapsed, for a value
+        that uses no variables.
+
+        """
+        return collapse_escapes(self.value)
+
+    def fill(self, level, order, rendered):
+        """Fill in the variables that come after level in the given order
+        (a dictionary of names to positions) with their rendered values.
+        Other uses of variables are left as they are. Escaped '$' characters
+        are not collapsed.
+
+        """
+        if len(self.parts) == 1:
+            return self.value
+        pieces = []
+        parts = self.parts
+        for ii in range(1, len(parts), 2):
+            pieces.append(parts[ii - 1])
+            position = order.get(parts[ii], -1)
+            if position > level:
+                pieces.append(rendered[position])
+            else:
+                pieces.append('${' + parts[ii] + '}')
+        pieces.append(parts[-1])
+        return ''.join(pieces)
+
+
+##############################################################################
+# Variables object
+
+class Variables(MutableMapping):
+    """The variables of a package, substituted on demand.
+
+    Each variable's raw value (or the value of the global variable with the
+    same name) may use other variables, forming a graph of dependencies.
+    A variable is substituted the first time it is used, after the
+    variables it depends on, and the result is kept. Variables that are
+    never used are never substituted. A variable that depends on itself,
+    directly or through others, raises InfiniteRecursionError.
+
+    Setting a variable overrides its value.
+
+    """
+    def __init__(self, raw_vars, global_variables):
+        self._raw = raw_vars
+        self._globals = global_variables
+        self._names = dict.fromkeys(raw_vars)
+        self._values = {}
+
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        if name not in self._names:
+            raise KeyError(name)
+        self._evaluate(name)
+        return self._values[name]
+
+    def __setitem__(self, name, value):
+        self._names[name] = None
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        del self._names[name]
+        self._values.pop(name, None)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __repr__(self):
+        return 'Variables({0!r}, evaluated={1!r})'.format(self._raw,
+                                                          self._values)
+
+    def evaluated(self):
+        """Get a dictionary of the variables substituted so far."""
+        return dict(self._values)
+
+    def _template(self, name):
+        # A global variable with the same name takes precedence over the
+        # value in the file
+        if name in self._globals:
+            return compile_template(self._globals[name])
+        return compile_template(self._raw[name])
+
+    def _evaluate(self, name):
+        # Substitute a variable and those it depends on, depth first. The
+        # variables being substituted form the path from name to the
+        # current variable, so using one of them again is a cycle. Each
+        # variable and each use of a variable is visited once.
+        visiting = set()
+        stack = [name]
+        while stack:
+            current = stack[-1]
+            if current in self._values:
+                stack.pop()
+                continue
+            template = self._template(current)
+            if current in visiting:
+                # The variables it uses have been substituted
+                self._values[current] = render(template, self._values,
+                                               self._globals)
+                visiting.discard(current)
+                stack.pop()
+                continue
+            visiting.add(current)
+            for dep in template.names:
+                if dep in self._values or dep in self._globals or \
+                        dep not in self._names:
+                    # Global variables are used as they are; undefined
+                    # variables are reported by render()
+                    continue
+                if dep in visiting:
+                    raise InfiniteRecursionError(dep)
+                stack.append(dep)
 
 
 ##############################################################################
@@ -116,17 +315,19 @@ def get_to_replace_re(name):
 
 
 def get_all_substitutions(value):
-    found_names = re.findall('(?<!\$)\${(?P<name>[\w.]+)\}', value, flags=re.U)
-    names = []
-    for name in found_names:
-        if name not in names:
-            names.append (name)
-    return names
+    # The names used in value, in the order they are first used
+    return list(compile_template(value).names)
 
 
 def collapse_escapes(value):
     return value.replace('$$', '$')
 
 
+# Memoized templates, by value
+_templates = {}
+# A use of a variable that is not escaped with a second '$'
+_reference_re = re.compile(r'(?<!\$)\$\{([\w.]+)\}', re.U)
+
+
 # vim: tw=79
 
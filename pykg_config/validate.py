@@ -0,0 +1,238 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: validate.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Validation of every installed package.
+
+Each pkg-config file found in the search path is parsed and fully
+processed, and its requirements and conflicts are checked (as they are
+when the package is found, but without following its requirements: each
+package's own problems are reported for it). Problems are
+returned as Problem objects rather than printed, so that they can be
+examined by tools. The files are divided between a pool of processes, each
+with its own searcher.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from pykg_config.exceptions import PykgConfigError
+from pykg_config.options import Options
+from pykg_config.package import Package
+from pykg_config.pcfile import find_malformed_lines, read_text
+from pykg_config.pkgcache import PackageCache
+from pykg_config.pkgsearcher import PkgSearcher, PackageNotFoundError
+from pykg_config.props import FLAG_PROPERTIES
+from pykg_config.result import PackageConflictError
+from pykg_config.substitute import InfiniteRecursionError, UndefinedVarError
+
+# Kinds of problems
+READ_ERROR = 'read-error'
+MALFORMED_LINE = 'malformed-line'
+PARSE_ERROR = 'parse-error'
+UNDEFINED_VARIABLE = 'undefined-variable'
+BAD_VERSION = 'bad-version'
+BAD_FLAGS = 'bad-flags'
+MISSING_REQUIREMENT = 'missing-requirement'
+CONFLICT = 'conflict'
+
+# Number of files given to a process at a time
+CHUNK_SIZE = 64
+
+##############################################################################
+# Problem object
+
+class Problem:
+    """A problem found in a pkg-config file.
+
+    Attributes:
+        pkgname -- The name of the package.
+        filename -- The pkg-config file with the problem.
+        kind -- The kind of problem, e.g. UNDEFINED_VARIABLE.
+        detail -- The line, variable, requirement, etc. at fault.
+
+    """
+    def __init__(self, pkgname, filename, kind, detail):
+        self.pkgname = pkgname
+        self.filename = filename
+        self.kind = kind
+        self.detail = detail
+
+    def __str__(self):
+        return '{0}: {1}: {2}'.format(self.filename, self.kind, self.detail)
+
+    def __repr__(self):
+        return 'Problem({0!r}, {1!r}, {2!r}, {3!r})'.format(self.pkgname,
+                self.filename, self.kind, self.detail)
+
+
+##############################################################################
+# Public functions
+
+def validate_all(globals, workers=None):
+    """Validate every pkg-config file found in the search path, using a
+    pool of worker processes (by default, one per CPU). With one worker,
+    the files are validated in this process.
+
+    Returns a list of Problems, in the order of the packages.
+
+    """
+    searcher = PkgSearcher(globals, package_cache=PackageCache())
+    files = [(pkgname, pcfile) \
+             for pkgname, pcfiles in searcher.known_pcfiles() \
+             for pcfile in pcfiles]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(files) <= CHUNK_SIZE:
+        return _validate_files(searcher, files)
+    # The error destination is a stream, which cannot be passed to another
+    # process; the workers do not print errors.
+    options = dict(Options().options)
+    del options['error_dest']
+    result = []
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(globals, options)) as pool:
+        chunks = [files[ii:ii + CHUNK_SIZE] \
+                  for ii in range(0, len(files), CHUNK_SIZE)]
+        for problems in pool.map(_validate_chunk, chunks):
+            result += problems
+    return result
+
+
+def validate_package(searcher, pkgname, pcfile):
+    """Validate one pkg-config file for a package.
+
+    Returns a list of Problems.
+
+    """
+    def problem(kind, detail):
+        return Problem(pkgname, pcfile, kind, detail)
+
+    result = []
+    try:
+        text, fields = read_text(pcfile)
+        if text is not None:
+            result += [problem(MALFORMED_LINE, line) \
+                       for line in find_malformed_lines(text)]
+        pkg = Package(pcfile, searcher.globals)
+    except IOError as e:
+        return result + [problem(READ_ERROR, e.strerror)]
+    except UndefinedVarError as e:
+        return result + [problem(UNDEFINED_VARIABLE, e.variable)]
+    except PykgConfigError as e:
+        return result + [problem(PARSE_ERROR, '{0}: {1}'.format(
+                type(e).__name__, e))]
+    # Badly-formatted versions are accepted when comparing versions, using
+    # the components before the part that cannot be parsed
+    if pkg.properties['version'].unparsed:
+        result.append(problem(BAD_VERSION, str(pkg.properties['version'])))
+    # Variables are substituted when used, so check the ones the properties
+    # do not use. Each undefined variable and the first cycle found are
+    # reported once.
+    undefined = set()
+    cycle = None
+    for name in pkg.variables:
+        try:
+            pkg.variables[name]
+        except UndefinedVarError as e:
+            if e.variable not in undefined:
+                undefined.add(e.variable)
+                result.append(problem(UNDEFINED_VARIABLE, e.variable))
+        except InfiniteRecursionError as e:
+            if cycle is None:
+                cycle = e
+                result.append(problem(PARSE_ERROR, '{0}: {1}'.format(
+                        type(e).__name__, e)))
+    # The flags are substituted when first used, too
+    for key in FLAG_PROPERTIES:
+        try:
+            pkg.properties[key]
+        except ValueError as e:
+            result.append(problem(BAD_FLAGS, str(e)))
+        except UndefinedVarError as e:
+            if e.variable not in undefined:
+                undefined.add(e.variable)
+                result.append(problem(UNDEFINED_VARIABLE, e.variable))
+        except InfiniteRecursionError as e:
+            if cycle is None:
+                cycle = e
+                result.append(problem(PARSE_ERROR, '{0}: {1}'.format(
+                        type(e).__name__, e)))
+    for dep in pkg.properties['requires.private']:
+        if searcher.package_exists(dep, searcher.globals):
+            continue
+        try:
+            # It may be provided by another package
+            searcher.search_for_package(dep, searcher.globals)
+        except PackageNotFoundError:
+            result.append(problem(MISSING_REQUIREMENT, str(dep)))
+        except (IOError, PykgConfigError):
+            # A problem with the requirement itself, reported for it
+            pass
+    for conflict in pkg.properties['conflicts']:
+        # As when finding the package, any installed package matching a
+        # conflict is an error
+        if searcher.package_exists(conflict, searcher.globals):
+            result.append(problem(CONFLICT, str(PackageConflictError(
+                    pkg.properties['name'], conflict))))
+    return result
+
+
+##############################################################################
+# Private functions
+
+# The searcher of a worker process
+_worker_searcher = None
+
+
+def _init_worker(globals, options):
+    global _worker_searcher
+    for option in options:
+        Options().set_option(option, options[option])
+    Options().set_option('print_errors', False)
+    _worker_searcher = PkgSearcher(globals, package_cache=PackageCache())
+
+
+def _validate_chunk(files):
+    return _validate_files(_worker_searcher, files)
+
+
+def _validate_files(searcher, files):
+    result = []
+    for pkgname, pcfile in files:
+        result += validate_package(searcher, pkgname, pcfile)
+    return result
+
+
+# vim: tw=79
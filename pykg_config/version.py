@@ -63,6 +63,16 @@ class BadVersionFormatError(ParseError):
 # Version class
 
 class Version:
+    """A version, made of components separated by '.', '-', etc.
+
+    Attributes:
+        raw_string -- The version as given.
+        comps -- The components, as integers where possible.
+        unparsed -- The trailing part of the version that could not be
+                    split into components, which is ignored. Empty for a
+                    well-formed version.
+
+    """
     def __init__(self, version_string=None):
         if version_string is not None:
             self._parse_version(version_string)
@@ -71,6 +81,7 @@ class Version:
         else:
             self.raw_string = '0'
             self.comps = [0]
+            self.unparsed = ''
 
     def __str__(self):
         return self.raw_string
@@ -116,15 +127,16 @@ class Version:
         # Parse a version into components.
         self.raw_string = version_string
         self.comps = []
+        self.unparsed = ''
         start = 0
         while start < len(version_string):
-            m = re.match(r'[-._~+ ]?(?P<comp>[a-zA-Z0-9%]+)',
-                         version_string[start:], re.U)
+            m = _component_re.match(version_string, start)
             if m is None:
                 # Stop pulling out components when the start of the string
                 # no longer matches
                 #raise BadVersionFormatError(version_string)
                 # pkg-config apparently ignores poorly-formatted versions
+                self.unparsed = version_string[start:]
                 return
             comp = m.group('comp')
             try:
@@ -132,7 +144,7 @@ class Version:
             except ValueError:
                 pass
             self.comps.append(comp)
-            start += m.end()
+            start = m.end()
 
     def _compare_components(self, other_comps):
         # Loop through the components, comparing each one in turn.
@@ -174,5 +186,12 @@ class Version:
         return 0
 
 
+##############################################################################
+# Private data
+
+# A component of a version, with the separator before it
+_component_re = re.compile(r'[-._~+ ]?(?P<comp>[a-zA-Z0-9%]+)', re.U)
+
+
 # vim: tw=79
 
@@ -0,0 +1,249 @@
+# Copyright (c) 2009-2012, Geoffrey Biggs
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of the Geoffrey Biggs nor the names of its
+#      contributors may be used to endorse or promote products derived from
+#      this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# File: watcher.py
+# Author: Geoffrey Biggs
+# Part of pykg-config.
+
+"""Watches the search directories of a PkgSearcher for changes.
+
+For long-running processes that embed pykg-config. Instead of creating a
+new PkgSearcher (and scanning every directory again) to notice newly
+installed packages, a PkgWatcher updates the searcher's entries for just
+the packages whose .pc files were added, removed or modified.
+
+inotify is used on Linux. Elsewhere, or if inotify cannot be used, the
+directories and the .pc files in them are polled for changes in their
+modification times.
+
+"""
+
+__version__ = "$Revision: $"
+# $Source$
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from pykg_config.dirindex import RACY_INTERVAL
+from pykg_config.errorprinter import ErrorPrinter
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+        IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+##############################################################################
+# PkgWatcher object
+
+class PkgWatcher:
+    """Keeps the known packages of a PkgSearcher up to date.
+
+    Call poll() periodically (or when fileno() becomes readable, if it is
+    not None) to apply any changes.
+
+    """
+    def __init__(self, searcher, use_inotify=True):
+        self.searcher = searcher
+        dirs = searcher.search_dirs()
+        self._backend = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self._backend = _InotifyBackend(dirs)
+            except OSError as e:
+                ErrorPrinter().debug_print('Cannot use inotify: %s', (e))
+        if self._backend is None:
+            self._backend = _PollBackend(dirs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fileno(self):
+        """A file descriptor that becomes readable when there are changes,
+        or None if the directories are being polled.
+
+        """
+        return self._backend.fileno()
+
+    def poll(self, timeout=0):
+        """Apply any changes made since the last call to the searcher.
+
+        Waits for up to timeout seconds for changes if there are none
+        (inotify only). Returns the set of package names that changed.
+
+        """
+        names = self._backend.changed_names(timeout)
+        if names is None:
+            ErrorPrinter().debug_print('Lost track of changes; rescanning')
+            names = self.searcher._rescan_all()
+        for name in names:
+            ErrorPrinter().debug_print('Package %s changed', (name))
+            self.searcher.refresh_package(name)
+        return names
+
+    def close(self):
+        self._backend.close()
+
+
+##############################################################################
+# Change detection backends
+#
+# changed_names() returns the set of package names with changed .pc files, or
+# None if changes may have been missed and everything must be rescanned.
+
+class _InotifyBackend:
+    def __init__(self, dirs):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        for d in dirs:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(d), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(err, 'Cannot watch {0}'.format(d))
+
+    def fileno(self):
+        return self._fd
+
+    def changed_names(self, timeout):
+        names = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        while readable:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                filename = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+                pos += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if filename.endswith('.pc'):
+                    names.add(filename[:-3])
+        return names
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class _PollBackend:
+    def __init__(self, dirs):
+        # For each directory, its mtime and the (mtime, size) of each .pc
+        # file in it
+        self._dirs = dict((d, _scan_dir(d)) for d in dirs)
+
+    def fileno(self):
+        return None
+
+    def changed_names(self, timeout):
+        names = set()
+        for d, (old_mtime, old_files) in self._dirs.items():
+            mtime = _mtime(d)
+            if mtime is not None and mtime == old_mtime and \
+                    time.time_ns() - mtime > RACY_INTERVAL:
+                # No files were added or removed, but the existing files must
+                # be checked because modifying a file does not change the
+                # mtime of its directory. A recently-modified directory is
+                # always listed again in case a file was added within the
+                # same timestamp tick.
+                files = {}
+                for filename in old_files:
+                    st = _stat(os.path.join(d, filename))
+                    if st is not None:
+                        files[filename] = st
+            else:
+                mtime, files = _scan_dir(d)
+            for filename in set(old_files) | set(files):
+                if old_files.get(filename) != files.get(filename):
+                    names.add(filename[:-3])
+            self._dirs[d] = (mtime, files)
+        return names
+
+    def close(self):
+        pass
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _stat(path):
+    # The parts of a file's status that show it has been modified.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _scan_dir(d):
+    # Get the mtime of a directory and the status of each .pc file in it.
+    mtime = _mtime(d)
+    files = {}
+    try:
+        with os.scandir(d) as entries:
+            for e in entries:
+                if e.name.endswith('.pc'):
+                    st = _stat(e.path)
+                    if st is not None:
+                        files[e.name] = st
+    except OSError:
+        pass
+    return mtime, files
+
+
+# vim: tw=79
+
@@ -34,16 +34,56 @@
 __version__ = "$Revision: $"
 # $Source$
 
+import builtins
+import io
 import os
+import random
 import re
+import shlex
+import shutil
 import subprocess
+import sys
+import tempfile
+import time
 import unittest
+import zipfile
 
+from pykg_config import __main__ as cli
+from pykg_config import batch
+from pykg_config import dirindex
+from pykg_config import flags
+from pykg_config import manifest
 from pykg_config import packagespeclist
+from pykg_config import parsedcache
+from pykg_config import pcfile
+from pykg_config import pkgcache
+from pykg_config import pkgdb
+from pykg_config import pkgsearcher
+from pykg_config import pkgtable
+from pykg_config import result
 from pykg_config import substitute
+from pykg_config import validate
 from pykg_config import dependency
+from pykg_config import package
 from pykg_config import version
+from pykg_config import watcher
+from pykg_config.options import Options
 from pykg_config.pkgconfig import call_pykgconfig
+from pykg_config.pkgsearcher import PkgSearcher
+
+
+def write_pc_file(directory, name, version='1', extra=''):
+    path = os.path.join(directory, name + '.pc')
+    with open(path, 'w') as f:
+        f.write('Name: {0}\nDescription: {0} package\nVersion: {1}\n{2}'.format(
+            name, version, extra))
+    return path
+
+
+def age_path(path, seconds=60):
+    # Move a path's modification time into the past
+    past = time.time() - seconds
+    os.utime(path, (past, past))
 
 
 class TestVersion(unittest.TestCase):
@@ -56,6 +96,12 @@ class TestVersion(unittest.TestCase):
     def test_constructor(self):
         for case, result in zip(self.strings, self.parsed):
             self.assertEqual(version.Version(case).comps, result)
+            self.assertEqual(version.Version(case).unparsed, '')
+
+    def test_unparsed(self):
+        ver = version.Version('1.0.x$@!')
+        self.assertEqual(ver.comps, [1, 0, 'x'])
+        self.assertEqual(ver.unparsed, '$@!')
 
     def test_comparisons(self):
         versions = []
@@ -106,6 +152,91 @@ class TestPackage(unittest.TestCase):
         self.assertEqual(parsed, expected)
 
 
+class TestHeaderOnly(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pcfile = os.path.join(self.tmp, 'hdr.pc')
+        with open(self.pcfile, 'w') as f:
+            f.write('ver=1.2\nlibdir=${missing}/lib\nName: hdr\n'
+                    'Description: header ${ver}\nURL: u\nVersion: ${ver}\n'
+                    'Requires: a\nRequires.private: b\nConflicts: c\n'
+                    'Provides: d\nLibs: -L${libdir}\nLibs: -lrepeated\n')
+
+    def tearDown(self):
+        Options().set_option('header_only', False)
+        shutil.rmtree(self.tmp)
+
+    def test_header_only(self):
+        self.assertRaises(pcfile.MultiplyDefinedValueError, package.Package,
+                          self.pcfile)
+        pkg = package.Package(self.pcfile, header_only=True)
+        self.assertEqual(str(pkg.properties['version']), '1.2')
+        self.assertEqual(pkg.properties['description'], 'header 1.2')
+        self.assertEqual([d.name for d in pkg.properties['requires.private']],
+                         ['b', 'a'])
+        self.assertEqual(pkg.properties['libs'], [])
+        self.assertEqual(pkg.variables.evaluated(), {'ver': '1.2'})
+        self.assertRaises(substitute.UndefinedVarError,
+                          lambda: pkg.variables['libdir'])
+
+    def test_flags_parsed_on_use(self):
+        write_pc_file(self.tmp, 'lazy', extra='Cflags: -I/lazy/include\n'
+                      'Libs: -L/lazy -llazy\nLibs.private: -lm\n')
+        pkg = package.Package(os.path.join(self.tmp, 'lazy.pc'))
+        self.assertEqual(pkg.properties.loaded_keys().count('libs'), 0)
+        self.assertEqual(pkg.properties['libs'], ['lazy'])
+        self.assertEqual(pkg.properties['libpaths'], ['/lazy'])
+        self.assertFalse('private.libs' in pkg.properties.loaded_keys())
+        self.assertFalse('include_dirs' in pkg.properties.loaded_keys())
+        self.assertEqual(pkg.properties['include_dirs'], ['/lazy/include'])
+        copied = pkg.with_flags_for({'pc_sysrootdir': '/sysroot'})
+        self.assertEqual(copied.properties['libpaths'], ['/sysroot/lazy'])
+        self.assertEqual(pkg.properties['libpaths'], ['/lazy'])
+
+    def test_flags_substituted_on_use(self):
+        bar = write_pc_file(self.tmp, 'bar', extra='libdir=/x\n'
+                            'Cflags: -I${undefinedvar}\n')
+        result = cli.find_packages('bar', {'config_path': [self.tmp],
+                                           'prefix': self.tmp})
+        self.assertEqual(result.get_variable_value('libdir'), '/x')
+        with self.assertRaises(substitute.UndefinedVarError) as cm:
+            result.get_cflags()
+        self.assertEqual((cm.exception.variable, cm.exception.pkgfile),
+                         ('undefinedvar', bar))
+
+    def test_variable_errors_reported(self):
+        write_pc_file(self.tmp, 'foo', extra='unused=${nothere}\n')
+        cycle = write_pc_file(self.tmp, 'cycle', extra='x=${y}\ny=${x}\n')
+        globals = {'config_path': [self.tmp], 'prefix': self.tmp}
+        errors = io.StringIO()
+        Options().set_option('error_dest', errors)
+        old_stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        statuses = []
+        try:
+            for pkgname, args in (('foo', ['--variable=unused']),
+                                  ('cycle', ['--variable=x']),
+                                  ('cycle', ['--dump-package'])):
+                options, rest = cli.setup_option_parser().parse_args(args)
+                res = cli.find_packages(pkgname, globals)
+                statuses.append(cli.process_result(options, res))
+        finally:
+            sys.stdout = old_stdout
+            Options().set_option('error_dest', sys.stderr)
+        self.assertEqual(statuses, [1, 1, 1])
+        self.assertEqual(errors.getvalue().splitlines(),
+                         ["Variable 'nothere' not defined in '{0}'".format(
+                             os.path.join(self.tmp, 'foo.pc'))] +
+                         ["Variable 'x' refers to itself in '{0}'".format(
+                             cycle)] * 2)
+
+    def test_searcher_uses_option(self):
+        Options().set_option('header_only', True)
+        searcher = PkgSearcher({'config_path': [self.tmp], 'prefix': self.tmp})
+        dep = packagespeclist.parse_package_spec_list('hdr >= 1.1')[0]
+        self.assertTrue(searcher.search_for_package(dep, {}).header_only)
+
+
 class TestSubstitutions(unittest.TestCase):
     def setUp(self):
         self.vars = {'blag1': 'not recursive',
@@ -122,6 +253,23 @@ class TestSubstitutions(unittest.TestCase):
         result = 'stuff references not recursive variable more stuff not recursive recursive with ${blag3}'
         self.assertEqual(substitute.substitute(value, self.vars), result)
 
+    def test_substituted_value_not_rescanned(self):
+        # Only variables used in the value itself are substituted within
+        # the substituted values
+        vars = {'blag4': 'uses ${undefined} and ${blag1}'}
+        self.assertEqual(substitute.substitute('${blag4}', vars),
+                         'uses ${undefined} and ${blag1}')
+
+    def test_compile_template(self):
+        template = substitute.compile_template('a ${b} $${c} ${d}${b}')
+        self.assertEqual(template.parts, ['a ', 'b', ' $${c} ', 'd', '',
+                                          'b', ''])
+        self.assertEqual(template.names, ['b', 'd'])
+        self.assertTrue(substitute.compile_template('a ${b} $${c} ${d}${b}')
+                        is template)
+        self.assertEqual(substitute.render(template, {'b': 'B', 'd': 'D'}),
+                         'a B ${c} DB')
+
     def test_get_to_replace_re(self):
         self.assertEqual(substitute.get_to_replace_re('blag'),
                          re.compile ('(?<!\\$)\\$\\{blag\\}', re.U))
@@ -141,6 +289,65 @@ class TestSubstitutions(unittest.TestCase):
         self.assertEqual(ret_code, 0)
 
 
+class TestVariables(unittest.TestCase):
+    def test_forward_reference(self):
+        vars = substitute.Variables({'libdir': '${prefix}/lib',
+                                     'prefix': '/usr'}, {})
+        self.assertEqual(vars['libdir'], '/usr/lib')
+
+    def test_only_dependencies_evaluated(self):
+        vars = substitute.Variables({'a': '${b}/a', 'b': '${c}', 'c': 'c',
+                                     'unused': '${undefined}',
+                                     'cycle': '${cycle}'}, {})
+        self.assertEqual(vars['a'], 'c/a')
+        self.assertEqual(vars.evaluated(), {'a': 'c/a', 'b': 'c', 'c': 'c'})
+        self.assertEqual(sorted(vars), ['a', 'b', 'c', 'cycle', 'unused'])
+        self.assertTrue('unused' in vars)
+        self.assertRaises(KeyError, lambda: vars['undefined'])
+
+    def test_cycle(self):
+        vars = substitute.Variables({'a': '${b}', 'b': 'x ${c}',
+                                     'c': '${a}'}, {})
+        self.assertRaises(substitute.InfiniteRecursionError,
+                          lambda: vars['a'])
+        vars = substitute.Variables({'self': 'x ${self}'}, {})
+        self.assertRaises(substitute.InfiniteRecursionError,
+                          lambda: vars['self'])
+
+    def test_shared_dependency(self):
+        vars = substitute.Variables({'a': '${b}${c}${b}', 'b': '${c}',
+                                     'c': 'c'}, {})
+        self.assertEqual(vars['a'], 'ccc')
+
+    def test_global_variables(self):
+        vars = substitute.Variables({'prefix': '/usr',
+                                     'libdir': '${prefix}/lib',
+                                     'loop': '${loop}'}, {'prefix': '/opt',
+                                                          'loop': 'g'})
+        self.assertEqual(vars['libdir'], '/opt/lib')
+        self.assertEqual(vars['loop'], 'g')
+        vars['prefix'] = '/set'
+        self.assertEqual(vars['prefix'], '/set')
+
+    def test_deep_chain(self):
+        raw = dict(('v{0}'.format(ii), '${{v{0}}}'.format(ii + 1))
+                   for ii in range(5000))
+        raw['v5000'] = 'end'
+        vars = substitute.Variables(raw, {})
+        self.assertEqual(vars['v0'], 'end')
+
+    def test_package_variable_value(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            write_pc_file(tmp, 'vars', extra='libdir=${exec_prefix}/lib\n'
+                          'exec_prefix=${prefix}\nprefix=/p\n')
+            pkg = package.Package(os.path.join(tmp, 'vars.pc'))
+            self.assertFalse('libdir' in pkg.variables.evaluated())
+            self.assertEqual(pkg.variables['libdir'], '/p/lib')
+        finally:
+            shutil.rmtree(tmp)
+
+
 class TestQuoteEscapes(unittest.TestCase):
 
     def test_maintain_escaping(self):
@@ -150,6 +357,1004 @@ class TestQuoteEscapes(unittest.TestCase):
 
 
 
+class TestTokenizer(unittest.TestCase):
+    def tokenize(self, text):
+        return list(pcfile.tokenize_pc(text))
+
+    def test_records(self):
+        self.assertEqual(self.tokenize('# comment\n\nprefix=/usr \n'
+                                       '  Name: foo # trailing\nEmpty:\n'
+                                       'x=\nnot a definition\nV:1\r\n'),
+                         [(pcfile.VARIABLE, 'prefix', '/usr'),
+                          (pcfile.PROPERTY, 'Name', 'foo'),
+                          (pcfile.PROPERTY, 'Empty', None),
+                          (pcfile.VARIABLE, 'x', ''),
+                          (pcfile.PROPERTY, 'V', '1')])
+
+    def test_continuation(self):
+        self.assertEqual(self.tokenize('Libs: -lfoo \\\n  -lbar\\\n-lbaz\n'
+                                       'Cflags: -I/x\\  \r\n-DY # \\\nZ\n'),
+                         [(pcfile.PROPERTY, 'Libs', '-lfoo   -lbar -lbaz'),
+                          (pcfile.PROPERTY, 'Cflags', '-I/x -DY')])
+        self.assertRaises(pcfile.TrailingContinuationCharError,
+                          self.tokenize, 'Name: foo\nLibs: -lfoo \\')
+
+
+class TestFlagSplitting(unittest.TestCase):
+    def setUp(self):
+        # Values built from these pieces exercise quoting, escaping and
+        # the whitespace characters shlex does and does not split on
+        pieces = ['-I', '-L', '-l', '-framework', 'foo', '/a b', '"', "'",
+                  '\\', ' ', '\t', '\n', '\r', '\f', '\xe9', '-DX="1 2"']
+        rand = random.Random(0)
+        self.corpus = [''.join(rand.choice(pieces)
+                               for ii in range(rand.randint(0, 10)))
+                       for jj in range(5000)]
+
+    def split(self, function, value):
+        try:
+            return [flag for kind, flag in function(value)]
+        except ValueError:
+            return ValueError
+
+    def shlex_split(self, value, posix):
+        try:
+            return shlex.split(value, posix=posix)
+        except ValueError:
+            return ValueError
+
+    def test_cflags_match_shlex(self):
+        for value in self.corpus:
+            self.assertEqual(self.split(flags.split_cflags, value),
+                             self.shlex_split(value, False), repr(value))
+
+    def test_libs_match_shlex(self):
+        for value in self.corpus:
+            expected = self.shlex_split(value, True)
+            if expected is not ValueError:
+                # Drop each -framework, as split_libs() does
+                ii = 0
+                while ii < len(expected) - 1:
+                    if expected[ii].startswith('-framework'):
+                        del expected[ii]
+                    ii += 1
+            self.assertEqual(self.split(flags.split_libs, value), expected,
+                             repr(value))
+
+    def test_kinds(self):
+        self.assertEqual(flags.split_cflags('-I/usr/include -DFOO "-Ia b"'),
+                         [(flags.INCLUDE_DIR, '-I/usr/include'),
+                          (flags.OTHER, '-DFOO'), (flags.OTHER, '"-Ia b"')])
+        self.assertEqual(flags.split_libs('-L"/a b" -lfoo -framework Cocoa '
+                                          '-pthread'),
+                         [(flags.LIB_PATH, '-L/a b'), (flags.LIB, '-lfoo'),
+                          (flags.FRAMEWORK, 'Cocoa'),
+                          (flags.OTHER, '-pthread')])
+
+
+class TestDirIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.tmp, d) for d in ('a', 'b')]
+        for d in self.dirs:
+            os.mkdir(d)
+            write_pc_file(d, 'common')
+        write_pc_file(self.dirs[0], 'first')
+        write_pc_file(self.dirs[1], 'second')
+        for d in self.dirs:
+            age_path(d)
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+        self.globals = {'config_path': self.dirs, 'prefix': self.tmp}
+
+    def tearDown(self):
+        Options().set_option('cache_dir', '')
+        shutil.rmtree(self.tmp)
+
+    def test_reuses_unchanged_entries(self):
+        index = dirindex.DirIndex.in_cache_dir(self.cache_dir)
+        mtime = os.stat(self.dirs[0]).st_mtime_ns
+        index.set(self.dirs[0], mtime, ['first.pc'])
+        index.save()
+        index = dirindex.DirIndex.in_cache_dir(self.cache_dir)
+        self.assertEqual(index.get(self.dirs[0], mtime), ['first.pc'])
+        self.assertEqual(index.get(self.dirs[0], mtime + 1), None)
+        self.assertEqual(index.get(self.dirs[1], mtime), None)
+
+    def test_racy_entries_not_stored(self):
+        index = dirindex.DirIndex.in_cache_dir(self.cache_dir)
+        mtime = time.time_ns()
+        index.set(self.dirs[0], mtime, ['first.pc'])
+        self.assertEqual(index.get(self.dirs[0], mtime), None)
+
+    def test_changed_directory_relisted(self):
+        Options().set_option('cache_dir', self.cache_dir)
+        self.scan()
+        os.remove(os.path.join(self.dirs[0], 'first.pc'))
+        age_path(self.dirs[0], 30)
+        self.assertFalse('first' in self.scan())
+
+    def scan(self):
+        searcher = PkgSearcher(self.globals)
+        searcher._scan_all()
+        return searcher._known_pkgs
+
+    def test_same_order_as_listing(self):
+        uncached = self.scan()
+        Options().set_option('cache_dir', self.cache_dir)
+        self.scan()
+        self.assertTrue(os.path.isfile(os.path.join(self.cache_dir,
+                                                    dirindex.INDEX_FILENAME)))
+        cached = self.scan()
+        self.assertEqual(cached, uncached)
+        self.assertEqual(cached['common'],
+                         [os.path.join(d, 'common.pc') for d in self.dirs])
+
+    def test_missing_package_remembered(self):
+        Options().set_option('cache_dir', self.cache_dir)
+        self.assertEqual(PkgSearcher(self.globals).search_for_pcfile('absent'),
+                         [])
+        searcher = PkgSearcher(self.globals)
+        probed = []
+        original = searcher._dir_contains
+        searcher._dir_contains = lambda d, f: probed.append(d) or original(d, f)
+        self.assertEqual(searcher.search_for_pcfile('absent'), [])
+        self.assertEqual([d for d in probed if d in self.dirs], [])
+        searcher.register_package('absent', text='Name: absent\n')
+        self.assertEqual(len(searcher.search_for_pcfile('absent')), 1)
+
+    def test_missing_package_added(self):
+        Options().set_option('cache_dir', self.cache_dir)
+        PkgSearcher(self.globals).search_for_pcfile('absent')
+        write_pc_file(self.dirs[1], 'absent')
+        age_path(self.dirs[1], 30)
+        self.assertEqual(PkgSearcher(self.globals).search_for_pcfile('absent'),
+                         [os.path.join(self.dirs[1], 'absent.pc')])
+
+
+class TestParsedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pcfile = write_pc_file(self.tmp, 'foo', extra='Libs: -lfoo\n')
+        age_path(self.pcfile)
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+        self.globals = {'prefix': '/usr'}
+        Options().set_option('cache_dir', self.cache_dir)
+
+    def tearDown(self):
+        Options().set_option('cache_dir', '')
+        shutil.rmtree(self.tmp)
+
+    def entries(self):
+        return os.listdir(os.path.join(self.cache_dir,
+                                       parsedcache.PARSED_DIRNAME))
+
+    def read_without_parsing(self, globals):
+        # Read the file, failing if it must be parsed
+        def fail(*args):
+            self.fail('File was parsed')
+        saved = pcfile.parse_pc_text
+        pcfile.parse_pc_text = fail
+        try:
+            return pcfile.read_pc_file(self.pcfile, globals)
+        finally:
+            pcfile.parse_pc_text = saved
+
+    def test_unchanged_file_not_parsed(self):
+        parsed = pcfile.read_pc_file(self.pcfile, self.globals)
+        self.assertEqual(len(self.entries()), 1)
+        self.assertEqual(self.read_without_parsing(self.globals), parsed)
+        pkg = package.Package(self.pcfile, self.globals)
+        self.assertEqual(pkg.properties['libs'], ['foo'])
+
+    def test_mismatch_parsed(self):
+        write_pc_file(self.tmp, 'foo', extra='Libs: -L${prefix}/lib\n')
+        age_path(self.pcfile)
+        pcfile.read_pc_file(self.pcfile, self.globals)
+        # The variables are substituted after reading the entry
+        raw_vars, vars, props = self.read_without_parsing({'prefix': '/opt'})
+        self.assertEqual(substitute.substitute(props['libs'], vars,
+                                               {'prefix': '/opt'}),
+                         '-L/opt/lib')
+        # The entry does not depend on the global variables
+        raw_vars, vars, props = self.read_without_parsing(self.globals)
+        self.assertEqual(props['libs'], '-L${prefix}/lib')
+        write_pc_file(self.tmp, 'foo', version='2')
+        age_path(self.pcfile, 30)
+        raw_vars, vars, props = pcfile.read_pc_file(self.pcfile,
+                                                    self.globals)
+        self.assertEqual(props['version'], '2')
+
+    def test_racy_file_not_stored(self):
+        write_pc_file(self.tmp, 'foo')
+        pcfile.read_pc_file(self.pcfile, self.globals)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir,
+                                        parsedcache.PARSED_DIRNAME)))
+
+    def test_corrupt_entry_ignored(self):
+        pcfile.read_pc_file(self.pcfile, self.globals)
+        entry = os.path.join(self.cache_dir, parsedcache.PARSED_DIRNAME,
+                             self.entries()[0])
+        with open(entry, 'w') as f:
+            f.write('{"format": 1, "key"')
+        raw_vars, vars, props = pcfile.read_pc_file(self.pcfile,
+                                                    self.globals)
+        self.assertEqual(props['name'], 'foo')
+
+    def test_least_recently_used_evicted(self):
+        cache = parsedcache.ParsedCache.in_cache_dir(self.cache_dir)
+        cache.max_entries = 4
+        cache.evict_interval = 1
+        st = cache.identity(self.pcfile)
+        results = {}
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            results[name] = ({'v': name}, {'name': name})
+            cache.set(self.pcfile, st, [name], *results[name])
+            if name == 'd':
+                for name, seconds in (('b', 90), ('c', 80), ('d', 70)):
+                    entry = cache._entry_path(parsedcache._key(self.pcfile,
+                                                               st, [name]))
+                    age_path(entry, seconds)
+                # Use 'a' so that 'b' and 'c' are the least recently used
+                self.assertEqual(cache.get(self.pcfile, st, ['a']),
+                                 results['a'])
+        # Trimmed to leave room for the next write
+        self.assertEqual(len(self.entries()), 3)
+        self.assertEqual(cache.get(self.pcfile, st, ['b']), None)
+        self.assertEqual(cache.get(self.pcfile, st, ['c']), None)
+        for name in ('a', 'd', 'e'):
+            self.assertEqual(cache.get(self.pcfile, st, [name]),
+                             results[name])
+
+    def test_eviction_checked_periodically(self):
+        cache = parsedcache.ParsedCache.in_cache_dir(self.cache_dir)
+        cache.max_entries = 4
+        cache.evict_interval = 3
+        cache._writes = 0
+        st = cache.identity(self.pcfile)
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            cache.set(self.pcfile, st, [name], {}, {'name': name})
+        # Not checked since the third write
+        self.assertEqual(len(self.entries()), 5)
+        cache.set(self.pcfile, st, ['f'], {}, {'name': 'f'})
+        self.assertEqual(len(self.entries()), 1)
+
+
+class TestLazySearch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.tmp, d) for d in ('a', 'b', 'c')]
+        for d in self.dirs[:2]:
+            os.mkdir(d)
+        self.old = write_pc_file(self.dirs[0], 'dup', version='1.0')
+        self.new = write_pc_file(self.dirs[1], 'dup', version='2.0')
+        self.searcher = PkgSearcher({'config_path': self.dirs,
+                                     'prefix': self.tmp})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_no_listing_for_single_package(self):
+        self.assertEqual(self.searcher.search_for_pcfile('dup'),
+                         [self.old, self.new])
+        self.assertEqual(self.searcher.search_for_pcfile('missing'), [])
+        self.assertEqual(self.searcher._known_pkgs, {})
+
+    def test_list_matching_packages(self):
+        write_pc_file(self.dirs[1], 'dup-extra', extra='Libs: ${undefined}\n')
+        write_pc_file(self.dirs[1], 'other')
+        self.assertEqual(self.searcher.package_names_matching('dup*'),
+                         ['dup', 'dup-extra'])
+        packages, errors = self.searcher.known_packages_list(['d?p', 'oth*'])
+        self.assertEqual(packages, [('dup', 'dup', 'dup package'),
+                                    ('other', 'other', 'other package')])
+        self.assertEqual(errors, [])
+
+    def test_later_candidates_used_for_version(self):
+        dep = packagespeclist.parse_package_spec_list('dup >= 2')[0]
+        pkg = self.searcher.search_for_package(dep, {})
+        self.assertEqual(pkg.filename, self.new)
+
+    def test_list_all_scans(self):
+        result, errors = self.searcher.known_packages_list()
+        self.assertEqual(result, [('dup', 'dup', 'dup package')])
+        self.assertEqual(self.searcher._known_pkgs['dup'],
+                         [self.old, self.new])
+
+    def test_list_all_errors(self):
+        with open(os.path.join(self.dirs[1], 'cycle.pc'), 'w') as f:
+            f.write('a=${b}\nb=${a}\nName: ${a}\nDescription: d\n'
+                    'Version: 1\n')
+        result, errors = self.searcher.known_packages_list()
+        self.assertEqual(result, [('dup', 'dup', 'dup package')])
+        self.assertEqual(errors, ["Variable 'a' refers to itself in "
+                                  "'{0}'".format(os.path.join(self.dirs[1],
+                                                              'cycle.pc'))])
+
+
+class TestParallelScan(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirs = []
+        for ii in range(6):
+            d = os.path.join(self.tmp, str(ii))
+            os.mkdir(d)
+            write_pc_file(d, 'common')
+            write_pc_file(d, 'only{0}'.format(ii))
+            self.dirs.append(d)
+        # A repeated directory must be dropped in the same way
+        self.dirs.insert(3, self.dirs[1] + '/.')
+
+    def tearDown(self):
+        Options().set_option('scan_workers', 0)
+        shutil.rmtree(self.tmp)
+
+    def scan(self, workers):
+        Options().set_option('scan_workers', workers)
+        searcher = PkgSearcher({'config_path': self.dirs, 'prefix': self.tmp})
+        searcher._scan_all()
+        return searcher._known_pkgs
+
+    def test_same_as_serial(self):
+        serial = self.scan(0)
+        parallel = self.scan(4)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(list(parallel), list(serial))
+        self.assertEqual(len(parallel['common']), 6)
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.tmp, d) for d in ('a', 'b')]
+        for d in self.dirs:
+            os.mkdir(d)
+        write_pc_file(self.dirs[1], 'pkg')
+        self.searcher = PkgSearcher({'config_path': self.dirs,
+                                     'prefix': self.tmp})
+        self.searcher._scan_all()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def check_changes(self, use_inotify):
+        with watcher.PkgWatcher(self.searcher, use_inotify) as w:
+            first = write_pc_file(self.dirs[0], 'pkg')
+            write_pc_file(self.dirs[0], 'new')
+            self.assertEqual(w.poll(1), set(['pkg', 'new']))
+            self.assertEqual(self.searcher._known_pkgs['pkg'],
+                             [first, os.path.join(self.dirs[1], 'pkg.pc')])
+            write_pc_file(self.dirs[0], 'new', version='2', extra='\n')
+            self.assertEqual(w.poll(1), set(['new']))
+            os.remove(first)
+            self.assertEqual(w.poll(1), set(['pkg']))
+            self.assertEqual(self.searcher.search_for_pcfile('pkg'),
+                             [os.path.join(self.dirs[1], 'pkg.pc')])
+
+    def test_polling(self):
+        self.check_changes(False)
+
+    def test_inotify(self):
+        self.check_changes(True)
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dir = os.path.join(self.tmp, 'pkgconfig')
+        os.mkdir(self.dir)
+        self.pcfile = write_pc_file(self.dir, 'pkg', version='1.2')
+        self.globals = {'config_path': [self.dir], 'prefix': self.tmp}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_write_and_read(self):
+        written = manifest.write_manifest(self.dir)
+        read = manifest.Manifest.read(self.dir)
+        self.assertEqual(read.mtime, os.stat(self.dir).st_mtime_ns)
+        self.assertEqual(read.pc_files(), ['pkg.pc'])
+        entry = read.header('pkg.pc', os.stat(self.pcfile))
+        self.assertEqual((entry['name'], entry['version'],
+                          entry['description']),
+                         ('pkg', '1.2', 'pkg package'))
+        self.assertEqual(read.entries, written.entries)
+
+    def test_list_all_uses_manifest(self):
+        manifest.write_manifest(self.dir)
+        # Change the recorded description; it must be used in place of the
+        # file's own
+        path = os.path.join(self.dir, manifest.MANIFEST_FILENAME)
+        with open(path, 'r') as f:
+            text = f.read()
+        with open(path, 'w') as f:
+            f.write(text.replace('pkg package', 'from manifest'))
+        result, errors = PkgSearcher(self.globals).known_packages_list()
+        self.assertEqual(result, [('pkg', 'pkg', 'from manifest')])
+
+    def test_stale_manifest_ignored(self):
+        manifest.write_manifest(self.dir)
+        write_pc_file(self.dir, 'pkg', version='1.2', extra='URL: x\n')
+        write_pc_file(self.dir, 'other')
+        result, errors = PkgSearcher(self.globals).known_packages_list()
+        self.assertEqual(sorted(result), [('other', 'other', 'other package'),
+                                          ('pkg', 'pkg', 'pkg package')])
+
+
+class TestPackageTable(unittest.TestCase):
+    def test_ordered_candidates(self):
+        table = pkgtable.PackageTable()
+        self.assertTrue(table.append('a', '/x', 'a.pc'))
+        self.assertTrue(table.append('b', '/x', 'b.pc'))
+        self.assertTrue(table.append('a', '/y', 'a.pc'))
+        self.assertFalse(table.append('a', '/x', 'a.pc'))
+        self.assertEqual(list(table), ['a', 'b'])
+        self.assertEqual(table['a'], ['/x/a.pc', '/y/a.pc'])
+        self.assertEqual(table.first('a'), '/x/a.pc')
+        self.assertEqual(table, {'a': ['/x/a.pc', '/y/a.pc'],
+                                 'b': ['/x/b.pc']})
+        self.assertEqual(table.get('c', []), [])
+
+    def test_replace_and_remove(self):
+        table = pkgtable.PackageTable()
+        for ii in range(3000):
+            table['p{0}'.format(ii)] = ['/x/p{0}.pc'.format(ii)]
+        for ii in range(0, 3000, 2):
+            del table['p{0}'.format(ii)]
+        table['p1'] = ['/z/p1.pc', '/x/p1.pc']
+        table['p3'] = []
+        self.assertEqual(len(table), 1499)
+        self.assertEqual(table['p1'], ['/z/p1.pc', '/x/p1.pc'])
+        self.assertEqual(table['p2999'], ['/x/p2999.pc'])
+        self.assertFalse('p3' in table)
+        self.assertTrue(len(table._row_next) < 3000)
+
+    def test_matching(self):
+        table = pkgtable.PackageTable()
+        for name in ('qt5-core', 'gstreamer-1.0', 'gst-plugins-base-1.0',
+                     'gstreamer-0.10', 'glib-2.0', 'qt'):
+            table.append(name, '/x', name + '.pc')
+        self.assertEqual(table.matching('qt*'), ['qt', 'qt5-core'])
+        self.assertEqual(table.matching('gst*-1.0'),
+                         ['gst-plugins-base-1.0', 'gstreamer-1.0'])
+        self.assertEqual(table.matching('*-2.0'), ['glib-2.0'])
+        self.assertEqual(table.matching('qt'), ['qt'])
+        del table['qt']
+        table.append('gst', '/x', 'gst.pc')
+        self.assertEqual(table.matching('[gq]*t'), ['gst'])
+
+
+class TestArchives(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dir = os.path.join(self.tmp, 'dir')
+        os.mkdir(self.dir)
+        self.on_disk = write_pc_file(self.dir, 'both', version='1')
+        self.archive = os.path.join(self.tmp, 'pcfiles.zip')
+        with zipfile.ZipFile(self.archive, 'w') as z:
+            z.writestr('lib/pkgconfig/both.pc',
+                       'Name: both\nDescription: zipped\nVersion: 2\n')
+            z.writestr('lib/pkgconfig/zipped.pc',
+                       'prefix=/zip\nName: zipped\nDescription: d\n'
+                       'Version: 3\nCflags: -I${prefix}/include\n')
+            z.writestr('top.pc', 'Name: top\nVersion: 1\n')
+        self.inner = os.path.join(self.archive, 'lib', 'pkgconfig')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def searcher(self, dirs):
+        return PkgSearcher({'config_path': dirs, 'prefix': self.tmp})
+
+    def test_priority_and_duplicates(self):
+        searcher = self.searcher([self.inner, self.dir, self.archive])
+        self.assertEqual(searcher.search_for_pcfile('both'),
+                         [os.path.join(self.inner, 'both.pc'), self.on_disk])
+        dep = packagespeclist.parse_package_spec_list('both < 2')[0]
+        self.assertEqual(searcher.search_for_package(dep, {}).filename,
+                         self.on_disk)
+        searcher._scan_all()
+        self.assertEqual(sorted(searcher._known_pkgs),
+                         ['both', 'top', 'zipped'])
+        self.assertEqual(len(searcher._known_pkgs['both']), 2)
+
+    def test_read_member(self):
+        searcher = self.searcher([self.dir, self.inner])
+        dep = packagespeclist.parse_package_spec_list('zipped')[0]
+        pkg = searcher.search_for_package(dep, {})
+        self.assertEqual(pkg.properties['include_dirs'], ['/zip/include'])
+        self.assertEqual(searcher.search_for_pcfile('top'), [])
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.on_disk = write_pc_file(self.tmp, 'gen', version='1')
+        write_pc_file(self.tmp, 'user', extra='Requires: gen >= 2\n')
+        self.searcher = PkgSearcher({'config_path': [self.tmp],
+                                     'prefix': self.tmp})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def find(self, spec):
+        dep = packagespeclist.parse_package_spec_list(spec)[0]
+        return self.searcher.search_for_package(dep, {})
+
+    def test_register_text(self):
+        self.searcher.register_package('gen', text='prefix=/gen\n'
+                'Name: gen\nDescription: generated\nVersion: 2\n'
+                'Libs: -L${prefix}/lib -lgen\n')
+        pkg = self.find('gen >= 2')
+        self.assertEqual(pkg.properties['libpaths'], ['/gen/lib'])
+        self.assertEqual(self.searcher.search_for_pcfile('gen')[1],
+                         self.on_disk)
+        self.searcher.unregister_package('gen')
+        self.assertEqual(self.searcher.search_for_pcfile('gen'),
+                         [self.on_disk])
+
+    def test_register_fields_last(self):
+        self.searcher.register_package('gen', variables={'v': '3'},
+                properties={'Name': 'gen', 'Version': '${v}',
+                            'Cflags': '-DX=1 # not a comment'},
+                first=False)
+        self.assertEqual(self.find('gen').filename, self.on_disk)
+        pkg = self.find('gen >= 2')
+        self.assertEqual(str(pkg.properties['version']), '3')
+        self.assertEqual(pkg.properties['other_cflags'],
+                         ['-DX=1', '#', 'not', 'a', 'comment'])
+
+    def test_resolves_dependencies(self):
+        res = result.PkgCfgResult({'config_path': [self.tmp],
+                                   'prefix': self.tmp})
+        res.searcher.register_package('gen', text='Name: gen\nVersion: 2\n'
+                                      'Cflags: -I/gen\n')
+        res.find_packages('user', True)
+        self.assertEqual(res.get_big_i_flags(), '-I/gen')
+
+    def test_listed(self):
+        self.searcher.register_package('only', text='Name: only\n'
+                'Description: in memory\nVersion: 1\n')
+        result, errors = self.searcher.known_packages_list()
+        self.assertTrue(('only', 'only', 'in memory') in result)
+        self.searcher.register_package('gen', text='Name: gen\nVersion: 2\n')
+        self.assertEqual(self.searcher.search_for_pcfile('gen')[0],
+                         self.searcher.search_for_pcfile('only')[0][:-7] +
+                         'gen.pc')
+        self.assertEqual(self.searcher.search_dirs(), [self.tmp])
+
+
+class TestStatCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.real = os.path.join(self.tmp, 'real')
+        os.mkdir(self.real)
+        write_pc_file(self.real, 'pkg')
+        self.link = os.path.join(self.tmp, 'link')
+        os.symlink(self.real, self.link)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_same_directory_searched_once(self):
+        searcher = PkgSearcher({'config_path': [self.real, self.link,
+                                                self.real + '/'],
+                                'prefix': self.tmp})
+        self.assertEqual(searcher.search_for_pcfile('pkg'),
+                         [os.path.join(self.real, 'pkg.pc')])
+        searcher._scan_all()
+        self.assertEqual(searcher._known_pkgs,
+                         {'pkg': [os.path.join(self.real, 'pkg.pc')]})
+
+    def test_stat_once(self):
+        cache = pkgsearcher.StatCache()
+        self.assertTrue(cache.isdir(self.real))
+        shutil.rmtree(self.real)
+        self.assertTrue(cache.isdir(self.real))
+        self.assertFalse(cache.isfile(self.real))
+        cache.clear()
+        self.assertFalse(cache.isdir(self.real))
+
+
+class TestProvides(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        write_pc_file(self.tmp, 'mesa-gl', version='21.3',
+                      extra='Provides: libgl = 4.6, opengl\n')
+        write_pc_file(self.tmp, 'user', extra='Requires: opengl\n')
+        self.globals = {'config_path': [self.tmp], 'prefix': self.tmp}
+        self.searcher = PkgSearcher(self.globals)
+        self.cache_dir = None
+
+    def tearDown(self):
+        Options().set_option('cache_dir', '')
+        shutil.rmtree(self.tmp)
+        if self.cache_dir is not None:
+            shutil.rmtree(self.cache_dir)
+
+    def find(self, spec):
+        dep = packagespeclist.parse_package_spec_list(spec)[0]
+        return self.searcher.search_for_package(dep, {})
+
+    def test_virtual_package(self):
+        pkg = self.find('libgl >= 4.5')
+        self.assertEqual(pkg.properties['name'], 'mesa-gl')
+        self.assertEqual([str(p) for p in pkg.properties['provides']],
+                         ['libgl=4.6', 'opengl'])
+        self.assertRaises(pkgsearcher.PackageNotFoundError, self.find,
+                          'libgl >= 5')
+        self.assertEqual(self.find('opengl >= 21').properties['name'],
+                         'mesa-gl')
+        res = result.PkgCfgResult(self.globals)
+        res.find_packages('user', True)
+        self.assertEqual(str(res.get_package_version('opengl')), '21.3')
+
+    def test_index_from_manifest(self):
+        manifest.write_manifest(self.tmp)
+        original = pkgsearcher.Package
+        pkgsearcher.Package = None
+        try:
+            index = self.searcher._provides_index()
+        finally:
+            pkgsearcher.Package = original
+        self.assertEqual([p[0] for p in index['libgl']], ['mesa-gl'])
+
+    def use_cache(self):
+        # Use a cache directory, with the files and their directory old
+        # enough to be recorded in it
+        self.cache_dir = tempfile.mkdtemp()
+        Options().set_option('cache_dir', self.cache_dir)
+        for name in ('mesa-gl', 'user'):
+            age_path(os.path.join(self.tmp, name + '.pc'))
+        age_path(self.tmp)
+        self.searcher = PkgSearcher(self.globals)
+
+    def test_index_reused(self):
+        self.use_cache()
+        self.assertRaises(pkgsearcher.PackageNotFoundError, self.find,
+                          'absent')
+        # Another searcher finds the Provides fields in the index
+        def fail(*args):
+            self.fail('File was read')
+        original = pkgsearcher.read_pc_file
+        pkgsearcher.read_pc_file = fail
+        try:
+            self.searcher = PkgSearcher(self.globals)
+            self.assertEqual(self.find('libgl').properties['name'],
+                             'mesa-gl')
+        finally:
+            pkgsearcher.read_pc_file = original
+        # A changed file is read again
+        write_pc_file(self.tmp, 'user', extra='Provides: other\n')
+        age_path(os.path.join(self.tmp, 'user.pc'), 30)
+        self.searcher = PkgSearcher(self.globals)
+        self.assertEqual(self.find('other').properties['name'], 'user')
+
+    def test_repeated_absent_probe(self):
+        for ii in range(50):
+            write_pc_file(self.tmp, 'pkg{0}'.format(ii))
+            age_path(os.path.join(self.tmp, 'pkg{0}.pc'.format(ii)))
+        self.use_cache()
+        self.assertRaises(pkgsearcher.PackageNotFoundError, self.find,
+                          'absent')
+        # Probing again, e.g. from another process, costs a stat() call or
+        # two per search directory (the parent of a missing directory is
+        # checked for an archive) and opens no pc files
+        counts = {'stat': 0, 'open': 0}
+        def counting_stat(path):
+            counts['stat'] += 1
+            return os.stat(path)
+        def counting_open(path, *args, **kwargs):
+            if str(path).endswith('.pc'):
+                counts['open'] += 1
+            return original_open(path, *args, **kwargs)
+        original_open = builtins.open
+        pkgsearcher.stat = counting_stat
+        builtins.open = counting_open
+        try:
+            for ii in range(2):
+                self.searcher = PkgSearcher(self.globals)
+                self.assertRaises(pkgsearcher.PackageNotFoundError,
+                                  self.find, 'absent')
+        finally:
+            pkgsearcher.stat = os.stat
+            builtins.open = original_open
+        self.assertEqual(counts['open'], 0)
+        self.assertTrue(counts['stat'] <=
+                        2 * 2 * len(self.searcher._search_dirs), counts)
+        # A new provider is found once its directory has changed
+        write_pc_file(self.tmp, 'newgl', extra='Provides: absent\n')
+        self.searcher = PkgSearcher(self.globals)
+        self.assertEqual(self.find('absent').properties['name'], 'newgl')
+
+    def test_refresh(self):
+        self.assertRaises(pkgsearcher.PackageNotFoundError, self.find, 'libglx')
+        write_pc_file(self.tmp, 'glvnd', extra='Provides: libglx\n')
+        self.searcher.refresh_package('glvnd')
+        self.assertEqual(self.find('libglx').properties['name'], 'glvnd')
+
+
+class TestConflicts(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        write_pc_file(self.tmp, 'app',
+                      extra='Conflicts: oldlib < 2, absent\nRequires: lib\n')
+        write_pc_file(self.tmp, 'lib')
+        self.globals = {'config_path': [self.tmp], 'prefix': self.tmp}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def find(self):
+        res = result.PkgCfgResult(self.globals)
+        res.find_packages('app', True)
+        return res
+
+    def test_conflict_found(self):
+        # Only the lines up to the version of a candidate are parsed
+        with open(os.path.join(self.tmp, 'oldlib.pc'), 'w') as f:
+            f.write('v=1.5\nName: oldlib\nVersion: ${v}\n'
+                    'Libs: ${undefined}\n')
+        self.assertRaises(result.PackageConflictError, self.find)
+
+    def test_conflict_version_not_met(self):
+        write_pc_file(self.tmp, 'oldlib', version='2.1')
+        self.assertEqual([name for name, pkg in self.find().packages],
+                         ['app', 'lib'])
+
+    def test_unversioned_conflict(self):
+        write_pc_file(self.tmp, 'absent', extra='Libs: ${undefined}\n')
+        searcher = PkgSearcher(self.globals)
+        dep = packagespeclist.parse_package_spec_list('absent')[0]
+        self.assertTrue(searcher.package_exists(dep, {}))
+        self.assertRaises(result.PackageConflictError, self.find)
+
+    def test_conflict_reported(self):
+        write_pc_file(self.tmp, 'absent')
+        errors = io.StringIO()
+        Options().set_option('error_dest', errors)
+        try:
+            with self.assertRaises(SystemExit) as cm:
+                cli.find_packages('app', self.globals)
+        finally:
+            Options().set_option('error_dest', sys.stderr)
+        self.assertEqual(cm.exception.code, 1)
+        self.assertEqual(errors.getvalue(), 'app conflicts with absent\n')
+
+
+class TestValidate(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        write_pc_file(self.tmp, 'good', extra='Requires: virtual\n')
+        write_pc_file(self.tmp, 'provider', extra='Provides: virtual\n')
+        write_pc_file(self.tmp, 'undefined', extra='Libs: -L${libdir}\n')
+        write_pc_file(self.tmp, 'malformed', extra='Cflags -I/x\n')
+        write_pc_file(self.tmp, 'missing', extra='Requires: absent >= 1\n')
+        write_pc_file(self.tmp, 'quote', extra='Libs: -L"/a b\n')
+        write_pc_file(self.tmp, 'unused', extra='v=${nope}\nw=${v}\n')
+        write_pc_file(self.tmp, 'cycle', extra='a=${b}\nb=${a}\n')
+        write_pc_file(self.tmp, 'badversion', version='1.0.x$@!')
+        write_pc_file(self.tmp, 'conflict',
+                      extra='Requires: good\nConflicts: provider\n')
+        self.globals = {'config_path': [self.tmp], 'prefix': self.tmp}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def problems(self, workers):
+        # Ignore any packages installed on the system
+        return [(p.pkgname, p.kind, p.detail) for p in
+                validate.validate_all(self.globals, workers)
+                if p.filename.startswith(self.tmp)]
+
+    def test_problems_found(self):
+        self.assertEqual(sorted(self.problems(1)),
+                         [('badversion', validate.BAD_VERSION, '1.0.x$@!'),
+                          ('conflict', validate.CONFLICT,
+                           'conflict conflicts with provider'),
+                          ('cycle', validate.PARSE_ERROR,
+                           'InfiniteRecursionError: a'),
+                          ('malformed', validate.MALFORMED_LINE,
+                           'Cflags -I/x'),
+                          ('missing', validate.MISSING_REQUIREMENT,
+                           'absent>=1'),
+                          ('quote', validate.BAD_FLAGS,
+                           'No closing quotation'),
+                          ('undefined', validate.UNDEFINED_VARIABLE,
+                           'libdir'),
+                          ('unused', validate.UNDEFINED_VARIABLE, 'nope')])
+
+    def test_parallel_same_as_serial(self):
+        for ii in range(2 * validate.CHUNK_SIZE):
+            write_pc_file(self.tmp, 'pkg{0}'.format(ii),
+                          extra='Requires: pkg{0}\n'.format(ii % 7))
+        write_pc_file(self.tmp, 'pkg5', extra='Libs: ${undefined}\n')
+        self.assertEqual(sorted(self.problems(1)),
+                         sorted(self.problems(3)))
+
+
+class TestVariableSets(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pcfile = write_pc_file(self.tmp, 'foo', version='${major}.0',
+                extra='prefix=/usr\nmajor=1\nincludedir=${prefix}/include\n'
+                      'Cflags: -I${includedir} -DFOO\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_with_globals(self):
+        pkg = package.Package(self.pcfile, {})
+        other = pkg.with_globals({'prefix': '/stage', 'major': '2'})
+        self.assertEqual(other.variables['includedir'], '/stage/include')
+        self.assertEqual(other.properties['include_dirs'],
+                         ['/stage/include'])
+        self.assertEqual(str(other.properties['version']), '2.0')
+        self.assertEqual(pkg.properties['include_dirs'], ['/usr/include'])
+        self.assertEqual(pkg.get_raw_property('cflags'),
+                         '-I${includedir} -DFOO')
+
+    def test_cache_evaluates_without_reading(self):
+        cache = pkgcache.PackageCache()
+        first = cache.load(self.pcfile, {'prefix': '/a'})
+        os.remove(self.pcfile)
+        second = cache.load(self.pcfile, {'prefix': '/b'})
+        third = cache.load(self.pcfile, {'prefix': '/a', 'unused': 'x'})
+        self.assertEqual((cache.misses, cache.hits), (1, 2))
+        self.assertEqual(first.properties['include_dirs'], ['/a/include'])
+        self.assertEqual(second.properties['include_dirs'], ['/b/include'])
+        self.assertEqual(third.properties['include_dirs'], ['/a/include'])
+
+    def test_checks_for_each_set(self):
+        options, args = cli.setup_option_parser().parse_args(
+                ['--atleast-version=2'])
+        statuses = []
+        for major in ('1', '2'):
+            globals = {'config_path': [self.tmp], 'prefix': self.tmp,
+                       'major': major}
+            res = cli.find_packages('foo', globals)
+            statuses.append(cli.process_result(options, res))
+        self.assertEqual(statuses, [1, 0])
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.configs = []
+        for arch in ('arm', 'aarch64'):
+            sysroot = os.path.join(self.tmp, arch)
+            pcdir = os.path.join(sysroot, 'opt', 'lib', 'pkgconfig')
+            os.makedirs(pcdir)
+            write_pc_file(pcdir, 'foo', extra='root=/opt\n'
+                          'Cflags: -I${root}/include/foo\n'
+                          'Libs: -L${root}/lib -lfoo\nRequires: bar\n')
+            write_pc_file(pcdir, 'bar', version=arch)
+            self.configs.append((pkgsearcher.TargetTriple(arch, 'linux', 'gnu'),
+                                 sysroot, [pcdir]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_sysroot_flags(self):
+        results = batch.resolve_batch('foo', self.configs,
+                                      {'prefix': self.tmp})
+        for result, (triple, sysroot, path) in zip(results, self.configs):
+            self.assertEqual(result.get_big_i_flags(),
+                             '-I' + os.path.join(sysroot, 'opt/include/foo'))
+            self.assertEqual(result.get_big_l_flags(),
+                             '-L' + os.path.join(sysroot, 'opt/lib'))
+            self.assertEqual(str(result.get_package_version('bar')),
+                             triple.arch)
+            self.assertEqual(result.searcher.triple, triple)
+        # Only foo.pc is identical in both sysroots
+        self.assertEqual(results[1].searcher._package_cache.hits, 1)
+        self.assertEqual(results[1].searcher._package_cache.misses, 3)
+
+    def test_errors_per_configuration(self):
+        os.remove(os.path.join(self.configs[0][2][0], 'bar.pc'))
+        results = batch.resolve_batch('foo', self.configs,
+                                      {'prefix': self.tmp})
+        self.assertTrue(isinstance(results[0],
+                                   pkgsearcher.PackageNotFoundError))
+        self.assertEqual(results[1].get_l_flags(), '-lfoo')
+
+    def test_refresh_forgets_parsed_package(self):
+        pcdir = self.configs[0][2][0]
+        searcher = PkgSearcher({'config_path': [pcdir], 'prefix': self.tmp},
+                               package_cache=pkgcache.PackageCache())
+        dep = packagespeclist.parse_package_spec_list('bar')[0]
+        self.assertEqual(str(searcher.search_for_package(dep, {}).properties[
+                'version']), 'arm')
+        write_pc_file(pcdir, 'bar', version='changed')
+        searcher.refresh_package('bar')
+        self.assertEqual(str(searcher.search_for_package(dep, {}).properties[
+                'version']), 'changed')
+        write_pc_file(pcdir, 'bar', version='rescanned')
+        searcher._rescan_all()
+        self.assertEqual(str(searcher.search_for_package(dep, {}).properties[
+                'version']), 'rescanned')
+
+
+class TestPackageDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.first = os.path.join(self.tmp, 'first')
+        self.second = os.path.join(self.tmp, 'second')
+        os.mkdir(self.first)
+        os.mkdir(self.second)
+        write_pc_file(self.first, 'gtk+-3.0', version='3.24',
+                      extra='Requires: glib-2.0 >= 2.50\nLibs: -lgtk-3\n')
+        write_pc_file(self.first, 'glib-2.0', version='2.72',
+                      extra='Libs: -lglib-2.0\nLibs.private: -lpcre\n')
+        write_pc_file(self.second, 'glib-2.0', version='2.40')
+        write_pc_file(self.second, 'gtkmm-3.0', version='3.24.5',
+                      extra='Requires: gtk+-3.0\n')
+        write_pc_file(self.second, 'broken', extra='Libs: ${undefined}\n')
+        for d in (self.first, self.second):
+            for name in os.listdir(d):
+                age_path(os.path.join(d, name))
+        self.searcher = PkgSearcher({'config_path': [self.first, self.second],
+                                     'prefix': self.tmp})
+        self.db = pkgdb.PackageDatabase(os.path.join(self.tmp, 'pkgs.db'),
+                                        self.searcher)
+        self.assertEqual(self.db.update(), 5)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def test_queries(self):
+        self.assertEqual(self.db.packages_matching('gtk*'),
+                         ['gtk+-3.0', 'gtkmm-3.0'])
+        self.assertEqual(self.db.packages_with_version('>=', '2.50'),
+                         [('glib-2.0', '2.72'), ('gtk+-3.0', '3.24'),
+                          ('gtkmm-3.0', '3.24.5')])
+        self.assertEqual(self.db.packages_with_version('<', '3'),
+                         [('glib-2.0', '2.72')])
+        self.assertEqual(self.db.library_providers('glib-2.0'), ['glib-2.0'])
+        self.assertEqual(self.db.library_providers('pcre'), [])
+        self.assertEqual(self.db.library_providers('pcre', True),
+                         ['glib-2.0'])
+        self.assertEqual(self.db.dependents('gtk+-3.0'), ['gtkmm-3.0'])
+        self.assertEqual(self.db.requires('gtk+-3.0'),
+                         [('requires', 'glib-2.0', '>=', '2.50')])
+        self.assertEqual(self.db.header('glib-2.0'),
+                         ('glib-2.0', 'glib-2.0 package', '2.72', ''))
+        self.assertEqual([path for path, error in self.db.errors()],
+                         [os.path.join(self.second, 'broken.pc')])
+
+    def test_incremental_update(self):
+        self.assertEqual(self.db.update(), 0)
+        os.remove(os.path.join(self.first, 'glib-2.0.pc'))
+        age_path(write_pc_file(self.first, 'gtk+-3.0', version='3.99'))
+        self.assertEqual(self.db.update(), 2)
+        self.assertEqual(self.db.header('glib-2.0')[2], '2.40')
+        self.assertEqual(self.db.header('gtk+-3.0')[2], '3.99')
+        self.assertEqual(self.db.dependents('glib-2.0'), [])
+        self.db.close()
+        self.db = pkgdb.PackageDatabase(self.db.filename, self.searcher)
+        self.assertEqual(self.db.update(), 0)
+        self.assertEqual(self.db.packages_matching('glib*'), ['glib-2.0'])
+
+    def test_racy_file_parsed_again(self):
+        # A file changed within the timestamp granularity could change again
+        # unnoticed, so it is not trusted until it is older
+        new = write_pc_file(self.first, 'gtk+-3.0', version='3.99')
+        self.assertEqual(self.db.update(), 1)
+        self.assertEqual(self.db.update(), 1)
+        age_path(new)
+        self.assertEqual(self.db.update(), 1)
+        self.assertEqual(self.db.update(), 0)
+
+    def test_globals_changed(self):
+        self.db.close()
+        searcher = PkgSearcher({'config_path': [self.first, self.second],
+                                'prefix': self.tmp, 'undefined': '-lx'})
+        self.db = pkgdb.PackageDatabase(self.db.filename, searcher)
+        self.assertEqual(self.db.update(), 5)
+        self.assertEqual(self.db.errors(), [])
+        self.assertEqual(self.db.update(), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
 